@@ -0,0 +1,402 @@
+"""Offline benchmark for Coc_Legend_bot.
+
+Runs monitor(), -leaderboard, the CSV export and -patterns against a local
+stub of api.clashk.ing and api.clashofclans.com, for synthetic rosters of
+increasing size. Nothing here talks to Discord or the real APIs.
+
+    python Coc_Legend_benchmark.py --sizes 10,100,1000 --latency-ms 5 --rate-429 0.01
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import io
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from aiohttp import web
+
+# === STUB UPSTREAM ===
+class StubUpstream:
+    """Local stand-in for ClashKing and the CoC API.
+
+    Every response waits `latency` seconds (plus jitter), a `rate_429`
+    fraction of requests is answered with 429, and `payload_days` controls
+    how many days a /legends history carries.
+    """
+
+    def __init__(self, latency=0.005, jitter=0.0, rate_429=0.0, payload_days=30, hits_per_day=8, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.payload_days = payload_days
+        self.hits_per_day = hits_per_day
+        self.random = random.Random(seed)
+        self.trophies = {}
+        self.requests = 0
+        self.throttled = 0
+        self.runner = None
+        self.base_url = None
+
+    async def delay(self):
+        self.requests += 1
+        await asyncio.sleep(self.latency + self.random.random() * self.jitter)
+        if self.rate_429 and self.random.random() < self.rate_429:
+            self.throttled += 1
+            return web.json_response({"reason": "requestThrottled"}, status=429)
+        return None
+
+    def hit(self, trophies, change):
+        return {
+            "change": change,
+            "time": int(time.time()) - self.random.randint(0, 86400),
+            "trophies": trophies,
+            "hero_gear": [
+                {"name": "Giant Gauntlet", "level": 27},
+                {"name": "Spiky Ball", "level": 27},
+                {"name": "Frozen Arrow", "level": 27},
+                {"name": "Magic Mirror", "level": 27}
+            ]
+        }
+
+    def legend_day(self, trophies):
+        attacks = [self.random.choice((16, 24, 32, 40)) for _ in range(self.hits_per_day)]
+        defenses = [self.random.choice((0, 8, 16, 24)) for _ in range(self.hits_per_day)]
+        return {
+            "attacks": attacks,
+            "defenses": defenses,
+            "new_attacks": [self.hit(trophies + sum(attacks[:i + 1]), a) for i, a in enumerate(attacks)],
+            "new_defenses": [self.hit(trophies - sum(defenses[:i + 1]), d) for i, d in enumerate(defenses)]
+        }
+
+    async def coc_player(self, request):
+        throttled = await self.delay()
+        if throttled:
+            return throttled
+        tag = request.match_info["tag"].lstrip("#")
+        # Trophies drift a little on every poll so monitor() sees real deltas
+        trophies = self.trophies.get(tag, 5000) + self.random.choice((-24, -16, 0, 0, 16, 32, 40))
+        self.trophies[tag] = trophies
+        return web.json_response({
+            "tag": f"#{tag}",
+            "name": f"Player {tag}",
+            "trophies": trophies,
+            "attackWins": 100 + trophies % 7,
+            "defenseWins": 20 + trophies % 5,
+            "townHallLevel": 17,
+            "clan": {"name": "Bench Clan", "tag": "#BENCH"},
+            "heroes": [
+                {"name": "Barbarian King", "level": 100},
+                {"name": "Archer Queen", "level": 100},
+                {"name": "Grand Warden", "level": 75},
+                {"name": "Royal Champion", "level": 50},
+                {"name": "Minion Prince", "level": 80}
+            ]
+        })
+
+    async def player_todo(self, request):
+        throttled = await self.delay()
+        if throttled:
+            return throttled
+        tag = request.query.get("player_tags", "#UNKNOWN")
+        trophies = self.trophies.get(tag.lstrip("#"), 5000)
+        return web.json_response({"items": [{"player_tag": tag, "legends": self.legend_day(trophies)}]})
+
+    async def player_legends(self, request):
+        throttled = await self.delay()
+        if throttled:
+            return throttled
+        tag = request.match_info["tag"]
+        start = datetime.now() - timedelta(days=self.payload_days)
+        legends = {
+            (start + timedelta(days=i)).date().isoformat(): self.legend_day(5000 + i * 10)
+            for i in range(self.payload_days)
+        }
+        return web.json_response({"name": f"Player {tag}", "tag": tag, "legends": legends})
+
+    async def global_counts(self, request):
+        throttled = await self.delay()
+        if throttled:
+            return throttled
+        return web.json_response({
+            "player_count": 90000000, "clan_count": 20000000, "players_in_legends": 300000,
+            "players_in_war": 4000000, "clans_in_war": 200000, "wars_stored": 500000000,
+            "total_join_leaves": 1000000000
+        })
+
+    async def generic(self, request):
+        throttled = await self.delay()
+        if throttled:
+            return throttled
+        return web.json_response({"items": []})
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application()
+        app.router.add_get("/v1/players/{tag}", self.coc_player)
+        app.router.add_get("/player/to-do", self.player_todo)
+        app.router.add_get("/player/{tag}/legends", self.player_legends)
+        app.router.add_get("/global/counts", self.global_counts)
+        app.router.add_get("/{tail:.*}", self.generic)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{bound_port}"
+        return self.base_url
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+# === FAKE DISCORD OBJECTS ===
+class FakeChannel:
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+
+class FakeAuthor:
+    def __init__(self, user_id=1):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+        self.name = f"user{user_id}"
+
+class FakeContext(FakeChannel):
+    """Just enough of commands.Context for command callbacks"""
+
+    def __init__(self, user_id=1):
+        super().__init__()
+        self.author = FakeAuthor(user_id)
+
+class FakeResponse:
+    def __init__(self):
+        self.done = False
+
+    async def defer(self, *args, **kwargs):
+        self.done = True
+
+    async def send_message(self, *args, **kwargs):
+        self.done = True
+
+    async def edit_message(self, *args, **kwargs):
+        self.done = True
+
+class FakeInteraction:
+    """Just enough of discord.Interaction for view callbacks"""
+
+    def __init__(self, user, custom_id=None):
+        self.user = user
+        self.response = FakeResponse()
+        self.followup = FakeChannel()
+        self.data = {"custom_id": custom_id} if custom_id else {}
+
+# === HARNESS ===
+def load_bot(workdir):
+    """Import Coc_Legend_bot with its state files inside workdir"""
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    module = importlib.import_module("Coc_Legend_bot")
+    logging.getLogger(module.__name__).setLevel(logging.CRITICAL)
+    return module
+
+def point_at_stub(bot_module, base_url):
+    bot_module.API = base_url
+    bot_module.COC_API = f"{base_url}/v1/players/"
+    channel = FakeChannel()
+    bot_module.bot.get_channel = lambda channel_id: channel
+    return channel
+
+def seed_roster(bot_module, size, seasonal_days=30):
+    """Replace the tracked players with `size` synthetic tags"""
+    bot_module.players.clear()
+    seasonal = {}
+    today = datetime.strptime(bot_module.get_current_clash_day(), "%Y-%m-%d")
+    for i in range(size):
+        tag = f"B{i:06d}"
+        bot_module.players[f"bench{i}"] = {"tag": tag, "legend": {"attack": 0, "defense": 0}, "last_reset_date": ""}
+        seasonal[tag] = {
+            (today - timedelta(days=d)).date().isoformat(): {
+                "offense": [40, 32, 24, 40, 16, 32, 40, 24],
+                "defense": [16, 24, 8, 0, 24, 32, 16, 8],
+                "start_trophies": 5000 + d
+            }
+            for d in range(1, seasonal_days + 1)
+        }
+    bot_module.save_players(bot_module.players)
+    bot_module.save_seasonal(seasonal)
+    bot_module.save_prev_trophies({})
+    bot_module.embed_cache.clear()
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def timed_runs(runs, make_call):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await make_call()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+async def bench_size(bot_module, size, args):
+    seed_roster(bot_module, size)
+    results = {"size": size}
+    quiet = io.StringIO()
+
+    tracemalloc.start()
+    with contextlib.redirect_stdout(quiet):
+        # The first pass only records baseline trophies
+        await bot_module.monitor.coro()
+        cycle_times = await timed_runs(args.cycles, bot_module.monitor.coro)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    mean_cycle = sum(cycle_times) / len(cycle_times)
+    results["monitor"] = {
+        "cycle_s": mean_cycle,
+        "cycles_per_min": 60 / mean_cycle if mean_cycle else float("inf"),
+        "interval_s": bot_module.MONITOR_INTERVAL_MINUTES * 60,
+        "peak_mem_mb": peak / 2**20
+    }
+
+    user = FakeAuthor()
+    player_name = next(iter(bot_module.players))
+    tag = bot_module.players[player_name]["tag"]
+    commands = {
+        "leaderboard": lambda: bot_module.leaderboard.callback(FakeContext()),
+        "export_player_data": lambda: bot_module.export_player_data(FakeInteraction(user), tag, player_name),
+        "attack_patterns": lambda: bot_module.attack_patterns.callback(FakeContext(), player_name)
+    }
+    # leaderboard polls every tag, so keep its runs bounded on big rosters
+    runs = {"leaderboard": max(1, min(args.command_runs, 2000 // size))}
+
+    for name, make_call in commands.items():
+        tracemalloc.start()
+        with contextlib.redirect_stdout(quiet):
+            latencies = await timed_runs(runs.get(name, args.command_runs), make_call)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {
+            "runs": len(latencies),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "peak_mem_mb": peak / 2**20
+        }
+    return results
+
+def bench_codecs(bot_module, stub, args, repeats=20):
+    """Compare stdlib json with the bot's codec on a /legends payload and seasonal state"""
+    legends = {
+        "name": "Player BENCH",
+        "tag": "#BENCH",
+        "legends": {f"2025-01-{i % 28 + 1:02d}-{i}": stub.legend_day(5000) for i in range(args.payload_days)}
+    }
+    raw_legends = json.dumps(legends).encode("utf-8")
+    seasonal = {
+        f"B{i:06d}": {
+            f"2025-01-{d:02d}": {"offense": [40, 32, 24, 40], "defense": [16, 24, 8, 0], "start_trophies": 5000}
+            for d in range(1, 29)
+        }
+        for i in range(1000)
+    }
+
+    def per_op(func):
+        started = time.perf_counter()
+        for _ in range(repeats):
+            func()
+        return (time.perf_counter() - started) / repeats * 1000
+
+    rows = [
+        ("decode /legends", lambda: json.loads(raw_legends),
+         lambda: bot_module.decode_payload("/player/{tag}/legends", raw_legends)),
+        ("encode seasonal (1000 tags)", lambda: json.dumps(seasonal, indent=2).encode("utf-8"),
+         lambda: bot_module.json_dumps(seasonal, pretty=bot_module.PERSIST_PRETTY)),
+    ]
+    codec = "orjson" if bot_module.orjson else "msgspec" if bot_module.msgspec else "stdlib json"
+    typed = "typed" if bot_module.TYPED_DECODERS else "untyped"
+    print(f"\nJSON codec: {codec} ({typed} API decoders)")
+    print(f"{'operation':<28} | {'stdlib ms':>9} | {'bot ms':>9} | {'speedup':>7}")
+    results = {}
+    for name, baseline, candidate in rows:
+        base_ms, bot_ms = per_op(baseline), per_op(candidate)
+        results[name] = {"stdlib_ms": base_ms, "bot_ms": bot_ms}
+        print(f"{name:<28} | {base_ms:>9.2f} | {bot_ms:>9.2f} | {base_ms / bot_ms:>6.1f}x")
+    pretty_size = len(json.dumps(seasonal, indent=2))
+    compact_size = len(bot_module.json_dumps(seasonal, pretty=bot_module.PERSIST_PRETTY))
+    print(f"seasonal file size: {pretty_size / 2**20:.1f} MB indented -> {compact_size / 2**20:.1f} MB as persisted")
+    return results
+
+def print_report(results, stub):
+    print(f"\n{'tags':>7} | {'cycle s':>8} | {'cycles/min':>10} | {'monitor MB':>10}")
+    for r in results:
+        m = r["monitor"]
+        print(f"{r['size']:>7} | {m['cycle_s']:>8.2f} | {m['cycles_per_min']:>10.2f} | {m['peak_mem_mb']:>10.1f}")
+
+    print(f"\n{'tags':>7} | {'command':<20} | {'runs':>5} | {'p50 ms':>8} | {'p99 ms':>8} | {'peak MB':>8}")
+    for r in results:
+        for name in ("leaderboard", "export_player_data", "attack_patterns"):
+            c = r[name]
+            print(
+                f"{r['size']:>7} | {name:<20} | {c['runs']:>5} | {c['p50_ms']:>8.1f} | "
+                f"{c['p99_ms']:>8.1f} | {c['peak_mem_mb']:>8.1f}"
+            )
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"\nStub served {stub.requests} requests ({stub.throttled} throttled with 429). Max RSS {max_rss:.0f} MB.")
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="coc-bench-")
+    bot_module = load_bot(workdir)
+    stub = StubUpstream(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        rate_429=args.rate_429,
+        payload_days=args.payload_days
+    )
+    base_url = await stub.start()
+    point_at_stub(bot_module, base_url)
+
+    results = []
+    try:
+        for size in args.sizes:
+            print(f"Benchmarking {size} tags...", flush=True)
+            results.append(await bench_size(bot_module, size, args))
+    finally:
+        if bot_module.session and not bot_module.session.closed:
+            await bot_module.session.close()
+        await stub.stop()
+
+    print_report(results, stub)
+    codec_results = bench_codecs(bot_module, stub, args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"sizes": results, "codec": codec_results}, f, indent=2)
+    print(f"State files left in {workdir}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")], default=[10, 100, 1000],
+                        help="Comma-separated roster sizes (default 10,100,1000; up to 10000)")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Base stub latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra latency per request")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--payload-days", type=int, default=30, help="Days returned by the /legends stub")
+    parser.add_argument("--cycles", type=int, default=2, help="Timed monitor() cycles per size")
+    parser.add_argument("--command-runs", type=int, default=20, help="Timed runs per command")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
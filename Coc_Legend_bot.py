@@ -1,16 +1,41 @@
 import discord
 from discord.ext import commands, tasks
 import aiohttp
+from aiohttp import web
 import json
 import os
 import asyncio
 import csv
 import io
+import copy
+import contextlib
+import contextvars
+import functools
+import hashlib
+import gzip
 import logging
+import re
+import signal
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
+from typing import Dict, List, TypedDict
 import pytz
 from urllib.parse import quote
 
+# Optional fast JSON codecs, picked up when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
 # === LOGGING SETUP ===
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -27,35 +52,812 @@ COC_HEADERS = {
 }
 HEADERS = {"accept": "application/json", "User-Agent": "Mozilla/5.0"}
 DATA_FILE = "players.json"
-SEASONAL_FILE = "seasonal.json"
+SEASONAL_FILE = "seasonal.json"  # Pre-segment single file, migrated on startup
+SEASONAL_DIR = "seasonal"
+SEASONAL_ARCHIVE_DIR = os.path.join(SEASONAL_DIR, "archive")
+PREV_FILE = "previous.json"
+SCHEDULE_FILE = "schedule_state.json"
+SNAPSHOT_DIR = "snapshots"
+SNAPSHOTS_KEPT = 12
+# Indent state files for hand editing; compact is smaller and faster to write
+PERSIST_PRETTY = False
+# Run state file I/O in worker threads; False keeps it on the event loop for comparison
+ASYNC_PERSISTENCE = True
+MONITOR_INTERVAL_MINUTES = 3
+# Cycles a delta the counters cannot explain waits for ClashKing before it is logged as estimated hits
+MAX_DEFERRED_CYCLES = 3
+# Most trophies a single legend league attack or defense can move
+MAX_HIT_TROPHIES = 40
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+# Opt-in span tracing of upstream calls, storage and embed builds
+TRACING_ENABLED = False
+TRACE_FILE = "traces.jsonl"
 IST = pytz.timezone("Asia/Kolkata")
 
 # Global session for connection pooling
 session = None
 
+# Rendered embeds kept for repeated identical queries
+EMBED_CACHE_SIZE = 256
+
+# Optional overrides/additions to the built-in hero and equipment table
+HERO_TABLE_FILE = "heroes.json"
+
+# Consecutive upstream failures that open a host's circuit, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_COOLDOWN_SECONDS = 30
+BREAKER_MAX_COOLDOWN_SECONDS = 300
+# Last good upstream responses kept to serve while a host is down
+STALE_CACHE_SIZE = 256
+# How long SIGTERM waits for a monitor cycle and in-flight requests before cancelling them
+SHUTDOWN_DEADLINE_SECONDS = 20
+
+# === METRICS ===
+METRICS = []
+
+class Metric:
+    """One Prometheus metric family with optional labels"""
+
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        METRICS.append(self)
+
+    def key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def format_labels(self, key, extra=None):
+        pairs = list(zip(self.label_names, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{self.format_labels(key)} {value}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        with self.lock:
+            key = self.key(labels)
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        with self.lock:
+            key = self.key(labels)
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value, count + 1)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{self.format_labels(key, {'le': str(bound)})} {bucket_count}")
+                lines.append(f"{self.name}_bucket{self.format_labels(key, {'le': '+Inf'})} {count}")
+                lines.append(f"{self.name}_sum{self.format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{self.format_labels(key)} {count}")
+        return lines
+
+UPSTREAM_LATENCY = Histogram("coc_upstream_request_seconds", "Upstream HTTP request latency", ("host", "endpoint"))
+UPSTREAM_RESPONSES = Counter("coc_upstream_responses_total", "Upstream responses by status code", ("host", "endpoint", "status"))
+UPSTREAM_RETRIES = Counter("coc_upstream_retries_total", "fetch_api attempts after the first", ("endpoint",))
+UPSTREAM_BACKOFF = Counter("coc_upstream_backoff_seconds_total", "Seconds slept in fetch_api exponential backoff", ("endpoint",))
+MONITOR_CYCLE = Histogram("coc_monitor_cycle_seconds", "Duration of one monitor() pass", buckets=(1, 5, 10, 30, 60, 120, 180, 300, 600))
+MONITOR_LAST_CYCLE = Gauge("coc_monitor_last_cycle_seconds", "Duration of the latest monitor() pass")
+MONITOR_INTERVAL = Gauge("coc_monitor_interval_seconds", "Configured monitor() polling interval")
+CACHE_REQUESTS = Counter("coc_cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+STATE_WRITE_BYTES = Histogram(
+    "coc_state_write_bytes", "Size of state file writes", ("file",),
+    buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+)
+COMMAND_LATENCY = Histogram("coc_command_seconds", "Command handling latency", ("command",))
+COMMAND_ERRORS = Counter("coc_command_errors_total", "Commands that raised", ("command",))
+LOOP_LAG = Gauge("coc_event_loop_lag_seconds", "Event loop wake-up lag over the sampling window", ("stat",))
+UPSTREAM_CIRCUIT = Gauge("coc_upstream_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ("host",))
+UPSTREAM_STALE = Counter("coc_upstream_stale_served_total", "Stale cached responses served for a failed call", ("host", "endpoint"))
+
+ENDPOINT_PATTERNS = [
+    (re.compile(r"^/player/search/.+$"), "/player/search/{name}"),
+    (re.compile(r"^/player/[^/]+/(legends|legend_rankings)$"), r"/player/{tag}/\1"),
+    (re.compile(r"^/ranking/legends/.+$"), "/ranking/legends/{tag}"),
+]
+
+def endpoint_label(endpoint):
+    """Collapse tags and names in an endpoint so metrics stay low-cardinality"""
+    for pattern, label in ENDPOINT_PATTERNS:
+        if pattern.match(endpoint):
+            return pattern.sub(label, endpoint)
+    return endpoint
+
+def render_metrics():
+    lag = loop_lag.summary()
+    for stat in ("max", "p99", "mean"):
+        LOOP_LAG.set(lag[f"{stat}_ms"] / 1000, stat=stat)
+    MONITOR_INTERVAL.set(MONITOR_INTERVAL_MINUTES * 60)
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+async def metrics_handler(request):
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+metrics_runner = None
+
+async def start_metrics_server():
+    """Serve /metrics on METRICS_HOST:METRICS_PORT for Prometheus scrapes"""
+    global metrics_runner
+    if metrics_runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    metrics_runner = web.AppRunner(app, access_log=None)
+    await metrics_runner.setup()
+    await web.TCPSite(metrics_runner, METRICS_HOST, METRICS_PORT).start()
+    logger.info(f"Metrics available at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+# === TRACING ===
+current_span = contextvars.ContextVar("current_span", default=None)
+recent_spans = deque(maxlen=2000)
+pending_spans = []
+
+class Span:
+    """A timed operation, written out in an OpenTelemetry-like JSON shape"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status", "token")
+
+    def __init__(self, name, attributes):
+        parent = current_span.get()
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.status = "OK"
+        self.token = None
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+def start_span(name, **attributes):
+    if not TRACING_ENABLED:
+        return None
+    span = Span(name, attributes)
+    span.token = current_span.set(span)
+    return span
+
+def end_span(span, error=None):
+    if span is None:
+        return
+    span.end_ns = time.time_ns()
+    if error is not None:
+        span.status = "ERROR"
+        span.attributes["error"] = repr(error)
+    try:
+        current_span.reset(span.token)
+    except ValueError:
+        pass  # Finished from a different context than it started in
+    recent_spans.append(span)
+    pending_spans.append(span)
+
+@contextlib.contextmanager
+def trace_span(name, **attributes):
+    span = start_span(name, **attributes)
+    try:
+        yield span
+    except Exception as e:
+        end_span(span, e)
+        span = None
+        raise
+    finally:
+        end_span(span)
+
+def traced(name, attributes=None):
+    """Wrap a sync or async function in a span; attributes() gets its arguments"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                attrs = attributes(*args, **kwargs) if attributes and TRACING_ENABLED else {}
+                with trace_span(name, **attrs):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            attrs = attributes(*args, **kwargs) if attributes and TRACING_ENABLED else {}
+            with trace_span(name, **attrs):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def append_trace_lines(path, lines):
+    with open(path, "a") as f:
+        f.write("".join(lines))
+
+# === JSON CODEC ===
+def json_dumps(data, pretty=False, sort_keys=False, default=None):
+    """Encode to UTF-8 JSON bytes with the fastest codec available"""
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if pretty else 0
+        if sort_keys:
+            # Sorted output is used for hashing, where json.dumps also accepted int keys
+            option |= orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        return orjson.dumps(data, option=option, default=default)
+    if msgspec is not None and not pretty and not sort_keys:
+        return msgspec.json.encode(data, enc_hook=default)
+    separators = None if pretty else (",", ":")
+    return json.dumps(
+        data, indent=2 if pretty else None, separators=separators, sort_keys=sort_keys, default=default
+    ).encode("utf-8")
+
+JSON_DECODE_ERRORS = (ValueError,) + ((msgspec.DecodeError,) if msgspec is not None else ())
+
+def json_loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    if msgspec is not None:
+        return msgspec.json.decode(raw)
+    return json.loads(raw)
+
+class HeroGearPayload(TypedDict, total=False):
+    name: str
+    level: int
+
+class LegendHitPayload(TypedDict, total=False):
+    change: int
+    time: int
+    trophies: int
+    hero_gear: List[HeroGearPayload]
+
+class LegendDayPayload(TypedDict, total=False):
+    attacks: List[int]
+    defenses: List[int]
+    new_attacks: List[LegendHitPayload]
+    new_defenses: List[LegendHitPayload]
+
+class TodoItemPayload(TypedDict, total=False):
+    player_tag: str
+    legends: LegendDayPayload
+
+class TodoPayload(TypedDict, total=False):
+    items: List[TodoItemPayload]
+
+class LegendsPayload(TypedDict, total=False):
+    name: str
+    tag: str
+    legends: Dict[str, LegendDayPayload]
+
+class RankingPayload(TypedDict, total=False):
+    rank: int
+
+# Typed decoders keep only the fields the bot reads, skipping the rest of large payloads
+PAYLOAD_TYPES = {
+    "/player/to-do": TodoPayload,
+    "/player/{tag}/legends": LegendsPayload,
+    "/ranking/legends/{tag}": RankingPayload,
+}
+TYPED_DECODERS = (
+    {label: msgspec.json.Decoder(payload_type) for label, payload_type in PAYLOAD_TYPES.items()}
+    if msgspec is not None else {}
+)
+
+def decode_payload(label, raw):
+    """Decode an API response, typed when the endpoint has a known schema"""
+    decoder = TYPED_DECODERS.get(label)
+    if decoder is not None:
+        try:
+            return decoder.decode(raw)
+        except msgspec.ValidationError as e:
+            logger.debug(f"Typed decode of {label} failed, falling back: {e}")
+    return json_loads(raw)
+
+# === MODELS ===
+class TrophyEvent:
+    """One attack or defense from a ClashKing legend log"""
+
+    __slots__ = ("kind", "change", "time", "trophies", "hero_gear")
+
+    def __init__(self, kind, change, time=0, trophies=0, hero_gear=()):
+        self.kind = kind
+        self.change = change
+        self.time = time
+        self.trophies = trophies
+        self.hero_gear = hero_gear
+
+    @classmethod
+    def from_api(cls, kind, hit):
+        return cls(
+            kind,
+            abs(hit.get("change", 0)),
+            hit.get("time", 0),
+            hit.get("trophies", 0),
+            tuple(hit.get("hero_gear") or ())
+        )
+
+    @property
+    def trophies_before(self):
+        return self.trophies - self.change if self.kind == "attack" else self.trophies + self.change
+
+    def to_dict(self):
+        return {"kind": self.kind, "change": self.change, "time": self.time, "trophies": self.trophies,
+                "hero_gear": list(self.hero_gear)}
+
+class LegendDay:
+    """Attacks and defenses for one legend day, from ClashKing or seasonal logs"""
+
+    __slots__ = ("date", "attacks", "defenses", "new_attacks", "new_defenses", "start_trophies",
+                 "offense", "defense")
+
+    def __init__(self, date, attacks=(), defenses=(), new_attacks=(), new_defenses=(), start_trophies=None):
+        self.date = date
+        self.attacks = tuple(attacks)
+        self.defenses = tuple(defenses)
+        self.new_attacks = tuple(new_attacks)
+        self.new_defenses = tuple(new_defenses)
+        self.start_trophies = start_trophies
+        self.offense = sum(self.attacks)
+        self.defense = sum(self.defenses)
+
+    @classmethod
+    def from_api(cls, date, day):
+        day = day or {}
+        return cls(
+            date,
+            day.get("attacks") or (),
+            day.get("defenses") or (),
+            (TrophyEvent.from_api("attack", hit) for hit in day.get("new_attacks") or ()),
+            (TrophyEvent.from_api("defense", hit) for hit in day.get("new_defenses") or ())
+        )
+
+    @classmethod
+    def from_log(cls, date, log):
+        """From a seasonal segment entry ({"offense", "defense", "start_trophies"})"""
+        return cls(date, log.get("offense") or (), log.get("defense") or (), start_trophies=log.get("start_trophies"))
+
+    @property
+    def net(self):
+        return self.offense - self.defense
+
+    @property
+    def active(self):
+        return bool(self.attacks or self.defenses)
+
+    @property
+    def initial_trophies(self):
+        """Lowest pre-attack trophy count of the day, or None without a hit log"""
+        if not self.new_attacks:
+            return None
+        return min(hit.trophies - hit.change for hit in self.new_attacks)
+
+    @property
+    def current_trophies(self):
+        if self.new_attacks:
+            return self.new_attacks[-1].trophies
+        if self.new_defenses:
+            return self.new_defenses[-1].trophies
+        return 0
+
+    @property
+    def latest_gear(self):
+        return self.new_attacks[-1].hero_gear if self.new_attacks else ()
+
+    def events_since(self, since_time):
+        """Hits newer than since_time in time order"""
+        events = [hit for hit in self.new_attacks + self.new_defenses if hit.time > since_time]
+        events.sort(key=lambda hit: hit.time)
+        return events
+
+    def to_dict(self):
+        return {
+            "date": self.date, "attacks": list(self.attacks), "defenses": list(self.defenses),
+            "new_attacks": [hit.to_dict() for hit in self.new_attacks],
+            "new_defenses": [hit.to_dict() for hit in self.new_defenses],
+            "start_trophies": self.start_trophies
+        }
+
+class Player:
+    """A player's legend days, decoded once from a ClashKing response"""
+
+    __slots__ = ("tag", "name", "days")
+
+    def __init__(self, tag, name="Unknown", days=None):
+        self.tag = tag.replace("#", "")
+        self.name = name
+        self.days = days or {}
+
+    @classmethod
+    def from_todo(cls, item):
+        """From one /player/to-do item, which carries only the current legend day"""
+        today = LegendDay.from_api(get_current_clash_day(), item.get("legends"))
+        return cls(item.get("player_tag", ""), days={today.date: today})
+
+    @classmethod
+    def from_legends(cls, payload):
+        """From a /player/{tag}/legends season history"""
+        days = {date: LegendDay.from_api(date, day) for date, day in sorted((payload.get("legends") or {}).items())}
+        return cls(payload.get("tag", ""), payload.get("name", "Unknown"), days)
+
+    @property
+    def today(self):
+        return next(reversed(self.days.values()), LegendDay(get_current_clash_day()))
+
+    @property
+    def dates(self):
+        return list(self.days)
+
+    def to_dict(self):
+        return {"tag": self.tag, "name": self.name, "days": [day.to_dict() for day in self.days.values()]}
+
+class SeasonSummary:
+    """Totals and extremes over a run of legend days"""
+
+    __slots__ = ("days", "total_offense", "total_defense", "attack_count", "defense_count", "active_days",
+                 "best_day", "worst_day")
+
+    def __init__(self, days):
+        self.days = list(days)
+        self.total_offense = sum(day.offense for day in self.days)
+        self.total_defense = sum(day.defense for day in self.days)
+        self.attack_count = sum(len(day.attacks) for day in self.days)
+        self.defense_count = sum(len(day.defenses) for day in self.days)
+        self.active_days = sum(1 for day in self.days if day.active)
+        self.best_day = max(self.days, key=lambda day: day.net, default=None)
+        self.worst_day = min(self.days, key=lambda day: day.net, default=None)
+
+    @classmethod
+    def from_seasonal(cls, player_logs):
+        return cls(LegendDay.from_log(date, player_logs[date]) for date in sorted(player_logs))
+
+    @property
+    def net(self):
+        return self.total_offense - self.total_defense
+
+# === SEASON CALENDAR ===
+def clash_reset_at(day):
+    """10:30 AM IST on the given date"""
+    return IST.localize(datetime(day.year, day.month, day.day, 10, 30))
+
+def last_daily_reset(now):
+    """Most recent daily reset at or before now"""
+    reset = clash_reset_at(now.date())
+    return reset if now >= reset else clash_reset_at(now.date() - timedelta(days=1))
+
+def season_end(year, month):
+    """Seasons end on the last Monday of the month at 10:30 AM IST"""
+    next_month = datetime(year + month // 12, month % 12 + 1, 1)
+    last_day = (next_month - timedelta(days=1)).date()
+    return clash_reset_at(last_day - timedelta(days=last_day.weekday()))
+
+def last_season_end(now):
+    """Most recent season end at or before now"""
+    end = season_end(now.year, now.month)
+    if now >= end:
+        return end
+    prev_month = now.date().replace(day=1) - timedelta(days=1)
+    return season_end(prev_month.year, prev_month.month)
+
+def season_id_for(moment):
+    """Season a moment belongs to, named after the month it ends in"""
+    end = season_end(moment.year, moment.month)
+    if moment < end:
+        return end.strftime("%Y-%m")
+    next_month = moment.date().replace(day=28) + timedelta(days=4)
+    return next_month.strftime("%Y-%m")
+
+def season_for_clash_day(clash_day):
+    """Season a clash day (YYYY-MM-DD) belongs to"""
+    return season_id_for(clash_reset_at(datetime.strptime(clash_day, "%Y-%m-%d").date()))
+
+def current_season_id():
+    return season_id_for(datetime.now(IST))
+
 # === DATA UTILS ===
+def atomic_write_json(path, data):
+    """Write JSON to a temp file, fsync it and rename it over the target"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(json_dumps(data, pretty=PERSIST_PRETTY))
+            f.flush()
+            os.fsync(f.fileno())
+        STATE_WRITE_BYTES.observe(os.path.getsize(tmp_path), file=os.path.basename(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(directory, os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def snapshot_name(path):
+    return os.path.splitext(os.path.normpath(path))[0].replace(os.sep, "_")
+
+def write_snapshot(path):
+    """Copy a state file into a checksummed snapshot, keeping the newest few"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        data = json.load(f)
+    body = json.dumps(data, sort_keys=True)
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    snap_path = os.path.join(SNAPSHOT_DIR, f"{snapshot_name(path)}.{stamp}.json")
+    atomic_write_json(snap_path, {
+        "sha256": hashlib.sha256(body.encode("utf-8")).hexdigest(),
+        "data": data
+    })
+
+    for old in list_snapshots(path)[SNAPSHOTS_KEPT:]:
+        os.remove(old)
+    return snap_path
+
+def list_snapshots(path):
+    """Snapshots for a state file, newest first"""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    prefix = f"{snapshot_name(path)}."
+    names = [n for n in os.listdir(SNAPSHOT_DIR) if n.startswith(prefix) and n.endswith(".json")]
+    return [os.path.join(SNAPSHOT_DIR, n) for n in sorted(names, reverse=True)]
+
+def read_snapshot(snap_path):
+    """Return a snapshot's data if its checksum matches, else None"""
+    try:
+        with open(snap_path, "r") as f:
+            snap = json.load(f)
+        body = json.dumps(snap["data"], sort_keys=True)
+        if hashlib.sha256(body.encode("utf-8")).hexdigest() == snap["sha256"]:
+            return snap["data"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    logger.warning(f"Discarding corrupt snapshot {snap_path}")
+    return None
+
+def load_json_checked(path, default=None):
+    """Load a state file, restoring the last good snapshot if it is damaged"""
+    if not os.path.exists(path):
+        return {} if default is None else default
+    try:
+        with open(path, "rb") as f:
+            data = json_loads(f.read())
+        if isinstance(data, dict):
+            return data
+        logger.error(f"{path} does not hold a JSON object")
+    except (OSError,) + JSON_DECODE_ERRORS as e:
+        logger.error(f"{path} failed integrity check: {e}")
+
+    # Keep the damaged file for inspection; the next save would overwrite it
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    try:
+        os.replace(path, f"{path}.corrupt-{stamp}")
+        logger.warning(f"Moved damaged {path} to {path}.corrupt-{stamp}")
+    except OSError as e:
+        logger.error(f"Could not move damaged {path} aside: {e}")
+
+    for snap_path in list_snapshots(path):
+        data = read_snapshot(snap_path)
+        if data is not None:
+            atomic_write_json(path, data)
+            logger.warning(f"Restored {path} from snapshot {snap_path}")
+            return data
+
+    logger.error(f"No usable snapshot for {path}, starting empty")
+    return {} if default is None else default
+
 def load_players():
-    return json.load(open(DATA_FILE)) if os.path.exists(DATA_FILE) else {}
+    return load_json_checked(DATA_FILE)
 
 def save_players(data):
-    json.dump(data, open(DATA_FILE, "w"), indent=2)
+    atomic_write_json(DATA_FILE, data)
 
-def load_seasonal():
-    return json.load(open(SEASONAL_FILE)) if os.path.exists(SEASONAL_FILE) else {}
+def seasonal_path(season=None):
+    return os.path.join(SEASONAL_DIR, f"{season or current_season_id()}.json")
 
-def save_seasonal(data):
-    json.dump(data, open(SEASONAL_FILE, "w"), indent=2)
+def archive_path(season):
+    return os.path.join(SEASONAL_ARCHIVE_DIR, f"{season}.json.gz")
 
-def load_prev_trophies(path="previous.json"):
-    if os.path.exists(path):
-        with open(path, "r") as f:
+def load_seasonal(season=None):
+    """Load one season segment, reading the archive if it was rotated out"""
+    season = season or current_season_id()
+    path = seasonal_path(season)
+    if not os.path.exists(path) and os.path.exists(archive_path(season)):
+        with gzip.open(archive_path(season), "rt") as f:
             return json.load(f)
-    return {}
+    return load_json_checked(path)
 
-def save_prev_trophies(prev_data, path="previous.json"):
-    with open(path, "w") as f:
-        json.dump(prev_data, f, indent=2)
+def save_seasonal(data, season=None):
+    os.makedirs(SEASONAL_DIR, exist_ok=True)
+    atomic_write_json(seasonal_path(season), data)
 
+def archive_season_segment(season):
+    """Compress a finished season segment into the archive and drop it"""
+    path = seasonal_path(season)
+    if not os.path.exists(path):
+        return None
+    data = load_json_checked(path)
+    os.makedirs(SEASONAL_ARCHIVE_DIR, exist_ok=True)
+    target = archive_path(season)
+    tmp_path = target + ".tmp"
+    with open(tmp_path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            f.write(json_dumps(data))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, target)
+    os.remove(path)
+    return target
+
+def migrate_legacy_seasonal():
+    """Move a pre-segment seasonal.json into the current season segment"""
+    if os.path.exists(SEASONAL_FILE) and not os.path.exists(seasonal_path()):
+        save_seasonal(load_json_checked(SEASONAL_FILE))
+        os.replace(SEASONAL_FILE, SEASONAL_FILE + ".migrated")
+        logger.info(f"Migrated {SEASONAL_FILE} into {seasonal_path()}")
+
+def load_prev_trophies(path=PREV_FILE):
+    return load_json_checked(path)
+
+def save_prev_trophies(prev_data, path=PREV_FILE):
+    atomic_write_json(path, prev_data)
+
+# === ASYNC PERSISTENCE ===
+class AsyncStore:
+    """Runs state file loads and saves in a dedicated worker pool.
+
+    Saves to the same path are applied in the order they were submitted, and
+    the time each call spends on the event loop thread is accumulated so the
+    inline and threaded modes can be compared with `-iostats`.
+    """
+
+    def __init__(self, workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="store")
+        self.path_locks = {}
+        self.loop_seconds = 0.0
+        self.calls = 0
+        self.closed = False
+
+    async def run(self, func, *args):
+        with trace_span(f"storage.{func.__name__}"):
+            started = time.perf_counter()
+            try:
+                if not ASYNC_PERSISTENCE or self.closed:
+                    return func(*args)
+                future = asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+            finally:
+                self.loop_seconds += time.perf_counter() - started
+                self.calls += 1
+            return await future
+
+    async def write(self, path, func, *args):
+        lock = self.path_locks.setdefault(path, asyncio.Lock())
+        async with lock:
+            return await self.run(func, *args)
+
+    async def update(self, path, load, save, mutate, *args):
+        """Load, mutate and save one file under its path lock.
+
+        Calls load(*args), then mutate(data) on the event loop, then
+        save(data, *args), so concurrent updates of the same file cannot
+        drop each other's changes. Returns whatever mutate returned.
+        """
+        lock = self.path_locks.setdefault(path, asyncio.Lock())
+        async with lock:
+            data = await self.run(load, *args)
+            result = mutate(data)
+            await self.run(save, data, *args)
+            return result
+
+    async def close(self):
+        """Drain queued work; anything submitted afterwards (a command still finishing) runs inline"""
+        self.closed = True
+        await asyncio.to_thread(self.executor.shutdown, True)
+
+store = AsyncStore()
+
+async def load_players_async():
+    return await store.run(load_players)
+
+async def save_players_async(data):
+    # players is shared with every command, so hand the worker its own copy
+    await store.write(DATA_FILE, save_players, copy.deepcopy(data))
+
+async def load_seasonal_async(season=None):
+    return await store.run(load_seasonal, season or current_season_id())
+
+async def update_seasonal_async(mutate, season=None):
+    """Apply mutate to one season segment without racing other writers of it"""
+    season = season or current_season_id()
+    return await store.update(seasonal_path(season), load_seasonal, save_seasonal, mutate, season)
+
+async def load_prev_trophies_async():
+    return await store.run(load_prev_trophies)
+
+async def save_prev_trophies_async(prev_data):
+    await store.write(PREV_FILE, save_prev_trophies, prev_data)
+
+class LoopLagMonitor:
+    """Samples how late the event loop wakes up, i.e. how long it was blocked"""
+
+    def __init__(self, interval=0.25, window=2400):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.task = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def summary(self):
+        if not self.samples:
+            return {"max_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0, "blocked_s": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "max_ms": ordered[-1] * 1000,
+            "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+            "mean_ms": sum(ordered) / len(ordered) * 1000,
+            "blocked_s": sum(ordered)
+        }
+
+loop_lag = LoopLagMonitor()
+
+migrate_legacy_seasonal()
 players = load_players()
 
 # === BOT SETUP ===
@@ -63,6 +865,333 @@ intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix="-", intents=intents)
 
+# === EMBED CACHE ===
+embed_cache = OrderedDict()
+
+def cache_default(value):
+    return value.to_dict() if hasattr(value, "to_dict") else str(value)
+
+def embed_cache_key(builder, *inputs):
+    """Key a rendered embed by its builder and a content hash of its inputs"""
+    payload = json_dumps(inputs, sort_keys=True, default=cache_default)
+    return f"{builder}:{hashlib.sha1(payload).hexdigest()}"
+
+def get_cached_embed(key):
+    """Rebuild an embed from its cached dict, or return None on a miss"""
+    data = embed_cache.get(key)
+    CACHE_REQUESTS.inc(cache=f"embed:{key.split(':', 1)[0]}", result="miss" if data is None else "hit")
+    if data is None:
+        return None
+    embed_cache.move_to_end(key)
+    embed = discord.Embed.from_dict(copy.deepcopy(data))
+    if "timestamp" in data:
+        embed.timestamp = datetime.now()
+    return embed
+
+def store_cached_embed(key, embed):
+    """Remember a rendered embed, evicting the least recently used ones"""
+    embed_cache[key] = copy.deepcopy(embed.to_dict())
+    embed_cache.move_to_end(key)
+    while len(embed_cache) > EMBED_CACHE_SIZE:
+        embed_cache.popitem(last=False)
+    return embed
+
+# === HERO TABLE ===
+# name: (search icon, stats icon, equipment)
+DEFAULT_HEROES = {
+    "Barbarian King": ("👑", "👑", (
+        "Barbarian Puppet", "Rage Vial", "Earthquake Boots", "Vampstache", "Giant Gauntlet", "Spiky Ball",
+        "Snake Bracelet"
+    )),
+    "Archer Queen": ("🏹", "👸", (
+        "Archer Puppet", "Invisibility Vial", "Giant Arrow", "Healer Puppet", "Frozen Arrow", "Magic Mirror",
+        "Action Figure"
+    )),
+    "Grand Warden": ("🧙", "🧚", (
+        "Eternal Tome", "Life Gem", "Rage Gem", "Healing Tome", "Fireball", "Lavaloon Puppet", "Heroic Torch"
+    )),
+    "Royal Champion": ("⚔️", "🎯", (
+        "Royal Gem", "Seeking Shield", "Hog Rider Puppet", "Haste Vial", "Rocket Spear", "Electro Boots"
+    )),
+    "Minion Prince": ("👾", "👹", (
+        "Henchmen Puppet", "Dark Orb", "Metal Pants", "Noble Iron", "Dark Crown"
+    )),
+}
+UNKNOWN_HERO = "Other"
+
+class HeroTable:
+    """Hero icons and an equipment -> hero index, built once and refreshed on demand.
+
+    heroes.json may add heroes or equipment in the DEFAULT_HEROES shape
+    ({"Hero": {"icon": ..., "stats_icon": ..., "equipment": [...]}}). The
+    CoC player API also reports what each hero has equipped, which learn()
+    folds in so new equipment is placed correctly before the table is edited.
+    """
+
+    def __init__(self):
+        self.load()
+
+    def load(self, path=HERO_TABLE_FILE):
+        heroes = {name: {"icon": icon, "stats_icon": stats_icon, "equipment": list(equipment)}
+                  for name, (icon, stats_icon, equipment) in DEFAULT_HEROES.items()}
+        overrides = load_json_checked(path, {}) if os.path.exists(path) else {}
+        for name, meta in overrides.items():
+            hero = heroes.setdefault(name, {"icon": "⚔️", "stats_icon": "⚔️", "equipment": []})
+            hero["icon"] = meta.get("icon", hero["icon"])
+            hero["stats_icon"] = meta.get("stats_icon", hero["stats_icon"])
+            hero["equipment"].extend(meta.get("equipment", []))
+        self.order = tuple(heroes)
+        self.icons = {name: hero["icon"] for name, hero in heroes.items()}
+        self.stats_icons = {name: hero["stats_icon"] for name, hero in heroes.items()}
+        self.equipment_hero = {equip: name for name, hero in heroes.items() for equip in hero["equipment"]}
+        gear_blocks.clear()
+
+    def learn(self, coc_data):
+        """Index equipment the CoC API shows on each hero"""
+        for hero in coc_data.get("heroes", []):
+            for equip in hero.get("equipment", []):
+                name = equip.get("name")
+                if name and self.equipment_hero.get(name) != hero.get("name") and hero.get("name") in self.icons:
+                    self.equipment_hero[name] = hero["name"]
+                    gear_blocks.clear()
+
+    def group(self, hero_gear):
+        """Gear per hero in table order, unrecognised equipment last"""
+        grouped = {}
+        for gear in hero_gear:
+            hero = self.equipment_hero.get(gear.get("name"), UNKNOWN_HERO)
+            grouped.setdefault(hero, []).append(gear)
+        order = {name: i for i, name in enumerate(self.order)}
+        return sorted(grouped.items(), key=lambda item: order.get(item[0], len(order)))
+
+# Formatted gear per (view, tag), reused until the player's gear or hero levels change
+gear_blocks = {}
+
+def cached_gear_block(view, tag, signature, build):
+    key = (view, tag)
+    cached = gear_blocks.get(key)
+    if cached is not None and cached[0] == signature:
+        CACHE_REQUESTS.inc(cache="gear", result="hit")
+        return cached[1]
+    CACHE_REQUESTS.inc(cache="gear", result="miss")
+    block = build()
+    gear_blocks[key] = (signature, block)
+    return block
+
+def gear_signature(hero_gear):
+    return tuple((gear.get("name"), gear.get("level")) for gear in hero_gear)
+
+hero_table = HeroTable()
+
+# === CIRCUIT BREAKER ===
+class CircuitBreaker:
+    """Per-host breaker: fail fast while a host is down, then let one probe through at a time"""
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, host, threshold=BREAKER_FAILURE_THRESHOLD, cooldown=BREAKER_COOLDOWN_SECONDS,
+                 max_cooldown=BREAKER_MAX_COOLDOWN_SECONDS):
+        self.host = host
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.open_for = cooldown
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = None
+        self.set_state(self.CLOSED)
+
+    def set_state(self, state):
+        self.state = state
+        UPSTREAM_CIRCUIT.set(state, host=self.host)
+
+    def allow(self):
+        """Whether a request may go out now; in half-open only the probe may"""
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now - self.opened_at < self.open_for:
+                return False
+            self.set_state(self.HALF_OPEN)
+            logger.info(f"Circuit for {self.host} half-open, probing")
+        # A probe that never reported back (cancelled command) must not wedge the breaker
+        if self.probe_started is not None and now - self.probe_started < self.cooldown:
+            return False
+        self.probe_started = now
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.probe_started = None
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit for {self.host} closed")
+            self.open_for = self.cooldown
+            self.set_state(self.CLOSED)
+
+    def is_probe(self):
+        """Call right after allow(): in half-open the one request let through is the probe"""
+        return self.state == self.HALF_OPEN
+
+    def record_failure(self, probe=False):
+        """Count a transport error, 429 or 5xx; in half-open only the probe's failure reopens"""
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            if probe:  # A request sent before the circuit opened says nothing about recovery
+                self.open_for = min(self.open_for * 2, self.max_cooldown)
+                self.trip()
+        elif self.state == self.CLOSED and self.failures >= self.threshold:
+            self.trip()
+
+    def trip(self):
+        self.probe_started = None
+        self.opened_at = time.monotonic()
+        self.set_state(self.OPEN)
+        logger.warning(f"Circuit for {self.host} open for {self.open_for}s after {self.failures} failures")
+
+breakers = {host: CircuitBreaker(host) for host in ("api.clashk.ing", "api.clashofclans.com")}
+# Only these count against a breaker (with 429 and 5xx responses)
+TRANSPORT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ConnectionResetError)
+
+# === STALE RESPONSES ===
+stale_cache = OrderedDict()
+# Ages of stale responses served to the current command or interaction
+stale_reads = contextvars.ContextVar("stale_reads", default=None)
+
+def remember_response(key, data):
+    stale_cache[key] = (time.time(), data)
+    stale_cache.move_to_end(key)
+    while len(stale_cache) > STALE_CACHE_SIZE:
+        stale_cache.popitem(last=False)
+
+def serve_stale(key, host, endpoint):
+    """Last good response for key, noting its age for mark_stale"""
+    entry = stale_cache.get(key)
+    if entry is None:
+        CACHE_REQUESTS.inc(cache="stale", result="miss")
+        return None
+    fetched_at, data = entry
+    CACHE_REQUESTS.inc(cache="stale", result="hit")
+    UPSTREAM_STALE.inc(host=host, endpoint=endpoint)
+    reads = stale_reads.get()
+    if reads is None:
+        reads = []
+        stale_reads.set(reads)
+    reads.append(time.time() - fetched_at)
+    return data
+
+def format_age(seconds):
+    if seconds < 60:
+        return f"{int(seconds)}s"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}m"
+    return f"{int(seconds // 3600)}h {int(seconds % 3600 // 60)}m"
+
+def mark_stale(embed):
+    """Copy of embed with a stale-data note if this command was served cached responses"""
+    reads = stale_reads.get()
+    if not reads:
+        return embed
+    embed = embed.copy()
+    note = f"⚠️ Stale data from {format_age(max(reads))} ago, upstream unavailable"
+    embed.set_footer(text=f"{embed.footer.text} | {note}" if embed.footer.text else note)
+    return embed
+
+# === SHUTDOWN ===
+class ShutdownCoordinator:
+    """Stops background work, drains upstream calls and flushes state on SIGTERM/SIGINT.
+
+    The monitor checks `stopping` between players, so a cycle always ends
+    with players.json, the seasonal segment and previous.json in step.
+    """
+
+    def __init__(self, deadline=SHUTDOWN_DEADLINE_SECONDS):
+        self.deadline = deadline
+        self.stopping = False
+        self.inflight = 0
+        self.busy = set()
+        self.task = None
+
+    @contextlib.contextmanager
+    def job(self, name):
+        """Mark a background job as mid-cycle so shutdown waits for it"""
+        self.busy.add(name)
+        try:
+            yield
+        finally:
+            self.busy.discard(name)
+
+    def install(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.trigger, sig)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: fall back to discord.py's KeyboardInterrupt handling
+
+    def trigger(self, sig=None):
+        if self.task is None:
+            logger.warning(f"Received {signal.Signals(sig).name if sig else 'shutdown'}, stopping")
+            self.task = asyncio.create_task(self.shutdown())
+
+    async def wait_idle(self, until):
+        while (self.inflight or self.busy) and time.monotonic() < until:
+            await asyncio.sleep(0.05)
+        return not (self.inflight or self.busy)
+
+    async def shutdown(self):
+        self.stopping = True
+        until = time.monotonic() + self.deadline
+        for loop in (monitor, snapshot_state, flush_traces):
+            loop.stop()
+
+        if not await self.wait_idle(until):
+            logger.warning(
+                f"Shutdown deadline passed with {self.inflight} requests and jobs {sorted(self.busy)} still running"
+            )
+        for loop in (monitor, snapshot_state, flush_traces):
+            loop.cancel()
+        for task in (reset_scheduler.task, loop_lag.task):
+            if task is not None:
+                task.cancel()
+
+        try:
+            if TRACING_ENABLED:
+                await flush_traces.coro()
+            await save_players_async(players)
+            # Let queued writes to every other file finish too
+            await store.close()
+        except Exception as e:
+            logger.error(f"Flushing state on shutdown failed: {e}")
+
+        if session is not None and not session.closed:
+            await session.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await bot.close()
+
+shutdown = ShutdownCoordinator()
+
+class ShuttingDown(commands.CheckFailure):
+    """A command arrived after shutdown began"""
+
+@bot.check
+async def accepting_commands(ctx):
+    if shutdown.stopping:
+        raise ShuttingDown()
+    return True
+
+def drained(func):
+    """Count a coroutine's upstream call as in flight for shutdown draining"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        shutdown.inflight += 1
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            shutdown.inflight -= 1
+    return wrapper
+
 # === ENHANCED SESSION MANAGEMENT ===
 async def get_session():
     """Get or create global aiohttp session with improved settings"""
@@ -90,48 +1219,98 @@ async def get_session():
         )
     return session
 
-async def fetch_api(endpoint, params=None, retries=3):
-    """Enhanced API fetch function with better error handling"""
+@traced("http.clashking", lambda endpoint, *args, **kwargs: {"endpoint": endpoint_label(endpoint)})
+@drained
+async def fetch_api(endpoint, params=None, retries=3, allow_stale=True):
+    """Enhanced API fetch function with better error handling.
+
+    Fails fast while the ClashKing circuit is open. When the call fails,
+    the last good response is served instead unless allow_stale is False.
+    """
+    label = endpoint_label(endpoint)
+    breaker = breakers["api.clashk.ing"]
+    key = ("api.clashk.ing", endpoint, tuple(sorted((params or {}).items())))
     for attempt in range(retries):
+        if not breaker.allow():
+            UPSTREAM_RESPONSES.inc(host="api.clashk.ing", endpoint=label, status="circuit_open")
+            break
+        probe = breaker.is_probe()
+        if attempt:
+            UPSTREAM_RETRIES.inc(endpoint=label)
+        started = time.perf_counter()
         try:
             api_session = await get_session()
             url = API + endpoint
             
             async with api_session.get(url, headers=HEADERS, params=params) as res:
+                UPSTREAM_RESPONSES.inc(host="api.clashk.ing", endpoint=label, status=res.status)
                 if res.status == 200:
-                    return await res.json()
-                else:
-                    logger.warning(f"API call failed: {endpoint}, status: {res.status}, attempt: {attempt + 1}")
-        except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionResetError) as e:
+                    body = await res.read()
+                    breaker.record_success()  # The host is fine even if the payload fails to decode
+                    data = decode_payload(label, body)
+                    UPSTREAM_LATENCY.observe(time.perf_counter() - started, host="api.clashk.ing", endpoint=label)
+                    remember_response(key, data)
+                    return data
+                UPSTREAM_LATENCY.observe(time.perf_counter() - started, host="api.clashk.ing", endpoint=label)
+                logger.warning(f"API call failed: {endpoint}, status: {res.status}, attempt: {attempt + 1}")
+                if res.status != 429 and res.status < 500:
+                    # The host answered; a 404 will not change on retry
+                    breaker.record_success()
+                    return None
+                breaker.record_failure(probe)
+        except TRANSPORT_ERRORS as e:
+            UPSTREAM_RESPONSES.inc(host="api.clashk.ing", endpoint=label, status=type(e).__name__)
             logger.error(f"API fetch error for {endpoint}, attempt {attempt + 1}: {e}")
-            if attempt < retries - 1:
-                # Close and recreate session on connection errors
-                if session and not session.closed:
-                    await session.close()
-                session = None
+            breaker.record_failure(probe)
+            if attempt < retries - 1 and breaker.state == CircuitBreaker.CLOSED:
+                UPSTREAM_BACKOFF.inc(2 ** attempt, endpoint=label)
                 await asyncio.sleep(2 ** attempt)  # Exponential backoff
         except Exception as e:
+            UPSTREAM_RESPONSES.inc(host="api.clashk.ing", endpoint=label, status="error")
+            # A decode or programming error is ours, not the host's: leave the breaker alone
             logger.error(f"Unexpected API fetch error for {endpoint}: {e}")
             break
     
-    return None
+    return serve_stale(key, "api.clashk.ing", label) if allow_stale else None
 
-async def fetch_coc(tag):
+@traced("http.coc", lambda tag, **kwargs: {"endpoint": "/players/{tag}"})
+@drained
+async def fetch_coc(tag, allow_stale=True):
     """Fetch player data from Clash of Clans API"""
+    breaker = breakers["api.clashofclans.com"]
+    key = ("api.clashofclans.com", tag)
+    if not breaker.allow():
+        UPSTREAM_RESPONSES.inc(host="api.clashofclans.com", endpoint="/players/{tag}", status="circuit_open")
+        return serve_stale(key, "api.clashofclans.com", "/players/{tag}") if allow_stale else None
+    probe = breaker.is_probe()
+    started = time.perf_counter()
     try:
         coc_session = await get_session()
         url = f"{COC_API}%23{tag}"
         headers = COC_HEADERS
         
         async with coc_session.get(url, headers=headers) as res:
+            UPSTREAM_RESPONSES.inc(host="api.clashofclans.com", endpoint="/players/{tag}", status=res.status)
+            UPSTREAM_LATENCY.observe(time.perf_counter() - started, host="api.clashofclans.com", endpoint="/players/{tag}")
             if res.status == 200:
-                return await res.json()
-            else:
-                logger.warning(f"COC API call failed: {tag}, status: {res.status}")
+                body = await res.read()
+                breaker.record_success()
+                data = json_loads(body)
+                remember_response(key, data)
+                return data
+            logger.warning(f"COC API call failed: {tag}, status: {res.status}")
+            if res.status != 429 and res.status < 500:
+                breaker.record_success()
                 return None
-    except Exception as e:
+            breaker.record_failure(probe)
+    except TRANSPORT_ERRORS as e:
+        UPSTREAM_RESPONSES.inc(host="api.clashofclans.com", endpoint="/players/{tag}", status=type(e).__name__)
         logger.error(f"COC API fetch error for {tag}: {e}")
-        return None
+        breaker.record_failure(probe)
+    except Exception as e:
+        UPSTREAM_RESPONSES.inc(host="api.clashofclans.com", endpoint="/players/{tag}", status="error")
+        logger.error(f"Unexpected COC API fetch error for {tag}: {e}")
+    return serve_stale(key, "api.clashofclans.com", "/players/{tag}") if allow_stale else None
 
 def get_current_clash_day():
     now = datetime.now(IST)
@@ -142,104 +1321,258 @@ def get_current_clash_day():
         clash_day = now.date().isoformat()
     return clash_day
 
-def is_season_reset_time():
-    """Check if it's last Monday 10:30 AM IST"""
-    now = datetime.now(IST)
-    return (
-        now.weekday() == 0 and  # Monday
-        (now + timedelta(days=7)).month != now.month and  # Last Monday
-        now.hour == 10 and now.minute == 30  # Exactly 10:30 AM
-    )
-
-def transfer_daily_to_seasonal():
-    """Transfer daily data from players.json to seasonal.json at 10:30 AM"""
-    clash_day = get_current_clash_day()
-    seasonal_data = load_seasonal()
-    
-    for name, info in players.items():
-        tag = info['tag']
+def merge_days_into_segment(days, seasonal_data):
+    """Copy (tag, clash_day, day_log) entries into a loaded season segment"""
+    for tag, clash_day, day_data in days:
+        # Keep start_trophies already recorded by monitor()
+        daily_data = seasonal_data.setdefault(tag, {}).setdefault(clash_day, {})
+        daily_data["offense"] = list(day_data.get("attack", []))
+        daily_data["defense"] = list(day_data.get("defense", []))
+        if day_data.get("start_trophies") is not None:
+            daily_data["start_trophies"] = day_data["start_trophies"]
+
+async def transfer_daily_to_seasonal(upto_day=None):
+    """Move finished clash days from players.json into their season segments.
+
+    Works on a copy of the roster, since -add/-remove can run while segments
+    load. Days leave players.json only once their segments are saved, so a
+    failed transfer can simply be retried.
+    """
+    upto_day = upto_day or get_current_clash_day()
+    segments = {}
+    moved = []
+    
+    for name, info in list(players.items()):
         legend_log = info.get("legend_log", {})
         
-        if clash_day in legend_log:
-            day_data = legend_log[clash_day]
-            
-            # Initialize player in seasonal if not exists
-            if tag not in seasonal_data:
-                seasonal_data[tag] = {}
-            
-            # Store the day's data
-            seasonal_data[tag][clash_day] = {
-                "offense": day_data.get("attack", []),
-                "defense": day_data.get("defense", []),
-                "start_trophies": day_data.get("start_trophies")
-            }
-    
-    save_seasonal(seasonal_data)
-    
-    # Clear daily data from players.json
-    for name, info in players.items():
-        info["legend_log"] = {}
-        info["legend"] = {"attack": 0, "defense": 0}
-    
-    save_players(players)
-    logger.info(f"Daily data transferred to seasonal.json for {clash_day}")
+        for clash_day in sorted(d for d in legend_log if d <= upto_day):
+            season = season_for_clash_day(clash_day)
+            segments.setdefault(season, []).append((info['tag'], clash_day, legend_log[clash_day]))
+            moved.append((info, clash_day))
+    
+    for season, days in segments.items():
+        await update_seasonal_async(functools.partial(merge_days_into_segment, days), season)
+
+    for info, clash_day in moved:
+        info["legend_log"].pop(clash_day, None)
+    for info in list(players.values()):
+        # Totals only cover the day still in progress
+        today_log = next(iter(info.get("legend_log", {}).values()), {"attack": [], "defense": []})
+        info["legend"] = {
+            "attack": sum(today_log.get("attack", [])),
+            "defense": sum(today_log.get("defense", []))
+        }
+    await save_players_async(players)
+    logger.info(f"Daily data transferred to seasonal segments for {sorted({day for _, day in moved}) or 'no days'}")
+
+# === RESET SCHEDULER ===
+class ResetScheduler:
+    """Runs the daily transfer and season reset exactly once per boundary.
+
+    The last transferred clash day and the last reset season are kept in
+    SCHEDULE_FILE, so a restart catches up on anything it slept through
+    without repeating work that already happened.
+    """
+
+    def __init__(self, path=SCHEDULE_FILE):
+        self.path = path
+        self.state = load_json_checked(path)
+        self.task = None
+
+    async def record(self, job, value):
+        self.state[job] = value
+        await store.write(self.path, atomic_write_json, self.path, dict(self.state))
+
+    async def run_due(self):
+        now = datetime.now(IST)
+        ended_day = (last_daily_reset(now) - timedelta(days=1)).date().isoformat()
+        season = last_season_end(now).strftime("%Y-%m")
+
+        if not self.state:
+            # First start: nothing was missed, just remember where we are
+            await self.record("daily_transfer", ended_day)
+            await self.record("seasonal_reset", season)
+            return
+
+        if self.state.get("daily_transfer") != ended_day:
+            await transfer_daily_to_seasonal(ended_day)
+            await self.record("daily_transfer", ended_day)
+
+        if self.state.get("seasonal_reset") != season:
+            await run_seasonal_reset(season)
+            await self.record("seasonal_reset", season)
+
+    async def run(self):
+        while True:
+            try:
+                with shutdown.job("reset"):
+                    await self.run_due()
+            except Exception as e:
+                logger.error(f"Reset scheduler error: {e}")
+                await asyncio.sleep(60)
+                continue
+            next_fire = last_daily_reset(datetime.now(IST)) + timedelta(days=1)
+            logger.info(f"Next reset check at {next_fire.isoformat()}")
+            await discord.utils.sleep_until(next_fire)
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+async def run_seasonal_reset(season):
+    """Roll over to the next season segment and archive the finished one.
+
+    New writes already land in the next segment because segments follow the
+    clock, so archiving runs in a worker thread without pausing monitor().
+    """
+    asyncio.create_task(archive_season(season))
+    print(f"🧹 Season {season} ended, now writing to {seasonal_path()}")
+
+    # Optional: Notify a channel
+    channel = bot.get_channel(CHANNEL_ID)
+    if channel:
+        await channel.send(f"🧹 Season `{season}` archived! A new season begins.")
+
+async def archive_season(season):
+    try:
+        target = await store.write(seasonal_path(season), archive_season_segment, season)
+        logger.info(f"Season {season} archived to {target}")
+    except Exception as e:
+        logger.error(f"Archiving season {season} failed: {e}")
+
+reset_scheduler = ResetScheduler()
 
 # === STARTUP ===
 @bot.event
 async def on_ready():
     print(f"✅ Logged in as {bot.user}")
-    seasonal_reset.start()
+    shutdown.install()
+    loop_lag.start()
+    if TRACING_ENABLED and not flush_traces.is_running():
+        flush_traces.start()
+    try:
+        await start_metrics_server()
+    except OSError as e:
+        logger.error(f"Metrics server failed to start: {e}")
+    reset_scheduler.start()
     monitor.start()
-    daily_transfer.start()
-
-# === DAILY DATA TRANSFER TASK ===
-@tasks.loop(minutes=1)
-async def daily_transfer():
-    """Transfer data at 10:30 AM IST daily"""
-    now = datetime.now(IST)
-    if now.hour == 10 and now.minute == 30:
-        transfer_daily_to_seasonal()
+    if not snapshot_state.is_running():
+        snapshot_state.start()
+
+# === STATE SNAPSHOTS ===
+@tasks.loop(minutes=30)
+async def snapshot_state():
+    """Keep checksummed snapshots of the state files for crash recovery"""
+    for path in (DATA_FILE, seasonal_path(), PREV_FILE):
+        try:
+            await store.write(path, write_snapshot, path)
+        except Exception as e:
+            logger.error(f"Snapshot of {path} failed: {e}")
+
+# === DELTA ATTRIBUTION ===
+def prev_snapshot(entry):
+    """Normalize a previous.json entry; older files stored bare trophy counts"""
+    if isinstance(entry, dict):
+        return entry
+    return {"trophies": entry}
+
+def refreshed_snapshot(coc_data, last_hit_time):
+    """previous.json entry for the player as of this poll"""
+    return {
+        "trophies": coc_data["trophies"],
+        "attackWins": coc_data.get("attackWins", 0),
+        "defenseWins": coc_data.get("defenseWins", 0),
+        "last_hit_time": last_hit_time
+    }
 
-# === SEASONAL RESET TASK ===
-@tasks.loop(minutes=3)
-async def seasonal_reset():
-    now = datetime.now(IST)
-    seasonal_path = SEASONAL_FILE
-    flag_file = "seasonal_reset.flag"
-
-    if is_season_reset_time():
-        # Prevent multiple resets in the same minute
-        if not os.path.exists(flag_file):
-            with open(seasonal_path, "w") as f:
-                json.dump({}, f, indent=2)
-            with open(flag_file, "w") as f:
-                f.write("reset done")
-
-            print("🧹 seasonal.json cleared on last Monday at 10:30 AM IST")
-
-            # Optional: Notify a channel
-            channel = bot.get_channel(CHANNEL_ID)
-            if channel:
-                await channel.send("🧹 `seasonal.json` cleared! A new season begins.")
-    else:
-        # Remove the flag if it's not the reset time anymore
-        if os.path.exists(flag_file):
-            os.remove(flag_file)
+def new_attack_wins(prev, coc_data):
+    """Attacks won since prev, from the CoC attackWins counter.
+
+    defenseWins only counts defenses the player held, so it says nothing
+    about how many defenses cost trophies.
+    """
+    attacks = coc_data.get("attackWins", 0)
+    return max(0, attacks - prev.get("attackWins", attacks))
+
+def split_evenly(total, hits):
+    """Split a total over a number of hits, spreading any remainder"""
+    base, extra = divmod(total, hits)
+    return [base + 1 if i < extra else base for i in range(hits)]
+
+def attribute_trophy_change(prev, coc_data, legend_day):
+    """Turn one polling interval's trophy delta into per-hit events.
+
+    ClashKing's hit log is used when its new hits add up to the delta.
+    Without it only a gain of exactly MAX_HIT_TROPHIES per new attackWins
+    rules out a lost defense; every other delta is deferred up to
+    MAX_DEFERRED_CYCLES polls so ClashKing can catch up, then logged as the
+    fewest hits that could explain it. Returns (events, resolved), where
+    events are (kind, trophies) pairs whose net always equals the delta. A
+    zero delta still has hits to log when an attack was won, e.g. a +32
+    attack and a -32 defense.
+    """
+    delta = coc_data["trophies"] - prev["trophies"]
+    new_attacks = new_attack_wins(prev, coc_data)
+    if delta == 0 and not new_attacks:
+        return [], True
+
+    if legend_day:
+        events = legend_day.events_since(prev.get("last_hit_time", 0))
+        net = sum(hit.change if hit.kind == "attack" else -hit.change for hit in events)
+        if events and net == delta:
+            return [(hit.kind, hit.change) for hit in events], True
+
+    if new_attacks and delta == MAX_HIT_TROPHIES * new_attacks:
+        return [("attack", MAX_HIT_TROPHIES)] * new_attacks, True
+    if "attackWins" not in prev and delta > 0 and delta % MAX_HIT_TROPHIES == 0 and delta <= 8 * MAX_HIT_TROPHIES:
+        # Entry from before the counters were stored: keep the old rule of splitting whole 40s
+        return [("attack", MAX_HIT_TROPHIES)] * (delta // MAX_HIT_TROPHIES), True
+
+    if prev.get("deferred", 0) < MAX_DEFERRED_CYCLES:
+        return [], False
+
+    if delta == 0:
+        logger.warning(f"Dropping hits that cancelled out after {MAX_DEFERRED_CYCLES} deferred cycles")
+        return [], True
+    kind = "attack" if delta > 0 else "defense"
+    hits = -(-abs(delta) // MAX_HIT_TROPHIES)
+    if kind == "attack":
+        hits = max(hits, new_attacks)
+    logger.warning(f"Logging delta {delta:+} as {hits} estimated {kind}(s) after {MAX_DEFERRED_CYCLES} deferred cycles")
+    return [(kind, t) for t in split_evenly(abs(delta), hits)], True
+
+# === TRACE FLUSH ===
+@tasks.loop(seconds=15)
+async def flush_traces():
+    """Append finished spans to TRACE_FILE as JSON lines"""
+    if not pending_spans:
+        return
+    lines = [json_dumps(span.to_dict()).decode("utf-8") + "\n" for span in pending_spans]
+    pending_spans.clear()
+    try:
+        await store.write(TRACE_FILE, append_trace_lines, TRACE_FILE, lines)
+    except Exception as e:
+        logger.error(f"Writing traces failed: {e}")
 
 # === MONITOR TASK ===
-@tasks.loop(minutes=1)
+@tasks.loop(minutes=MONITOR_INTERVAL_MINUTES)
 async def monitor():
+    cycle_started = time.perf_counter()
+    cycle_span = start_span("task.monitor", players=len(players))
+    shutdown.busy.add("monitor")
     try:
         channel = bot.get_channel(CHANNEL_ID)
         now = datetime.now(IST)
         clash_day = get_current_clash_day()
 
         # Load previous trophies from separate file
-        prev_data = load_prev_trophies()
+        prev_data = await load_prev_trophies_async()
 
         for name, info in players.items():
+            if shutdown.stopping:
+                break  # Each player's files are already consistent; leave the rest for the next start
             tag = info['tag']
-            coc_data = await fetch_coc(tag)
+            coc_data = await fetch_coc(tag, allow_stale=False)
             if not coc_data:
                 print(f"[{name}] No coc data.")
                 continue
@@ -249,61 +1582,82 @@ async def monitor():
                 print(f"[{name}] No trophy data.")
                 continue
 
-            prev_trophies = prev_data.get(name)
-            if prev_trophies is None:
-                prev_data[name] = trophies
-                save_prev_trophies(prev_data)
+            if name not in prev_data:
+                prev_data[name] = refreshed_snapshot(coc_data, int(now.timestamp()))
+                await save_prev_trophies_async(prev_data)
                 continue  # First run, skip to avoid fake delta
 
+            prev = prev_snapshot(prev_data[name])
+            prev_trophies = prev["trophies"]
             delta = trophies - prev_trophies
             print(f"[{name}] Current: {trophies}, Previous: {prev_trophies}, Delta: {delta}")
 
-            if delta == 0:
-                continue  # No change
+            if delta == 0 and not new_attack_wins(prev, coc_data):
+                # No hits; still keep the counters current (they reset with the season)
+                snapshot = refreshed_snapshot(coc_data, prev.get("last_hit_time", 0))
+                if snapshot != prev_data[name]:
+                    prev_data[name] = snapshot
+                    await save_prev_trophies_async(prev_data)
+                continue
 
-            change_type = "attack" if delta > 0 else "defense"
-            abs_delta = abs(delta)
+            # Only ask ClashKing for the hit log when something changed
+            legend_day = None
+            realtime_data = await fetch_api("/player/to-do", {"player_tags": f"#{tag}"}, allow_stale=False)
+            if realtime_data and realtime_data.get("items"):
+                legend_day = Player.from_todo(realtime_data["items"][0]).today
+
+            events, resolved = attribute_trophy_change(prev, coc_data, legend_day)
+            if not resolved:
+                prev["deferred"] = prev.get("deferred", 0) + 1
+                prev_data[name] = prev
+                await save_prev_trophies_async(prev_data)
+                print(f"[{name}] Unexplained delta {delta:+}, waiting for hit log ({prev['deferred']}/{MAX_DEFERRED_CYCLES})")
+                continue
+
+            hit_times = [hit.time for hit in legend_day.events_since(0)] if legend_day else []
+            snapshot = refreshed_snapshot(coc_data, max(hit_times + [prev.get("last_hit_time", 0)]))
+            if not events:
+                prev_data[name] = snapshot
+                await save_prev_trophies_async(prev_data)
+                continue
 
             # === Update players.json ===
             legend_log = info.setdefault("legend_log", {})
             day_log = legend_log.setdefault(clash_day, {"attack": [], "defense": []})
 
-            # Split large offense gains like +80, +120 into [40, 40]
-            if change_type == "attack" and abs_delta in [80, 120, 160, 200, 240, 280, 320]:
-                chunks = [40] * (abs_delta // 40)
-                day_log[change_type].extend(chunks)
-            else:
-                day_log[change_type].append(abs_delta)
+            for change_type, change in events:
+                day_log[change_type].append(change)
 
             info["legend"] = {
                 "attack": sum(day_log["attack"]),
                 "defense": sum(day_log["defense"])
             }
 
-            save_players(players)
-
-            # === Update seasonal.json ===
-            seasonal_data = load_seasonal()
-            seasonal_data.setdefault(tag, {})
-            daily_data = seasonal_data[tag].setdefault(clash_day, {
-                "offense": [],
-                "defense": []
-            })
-
-            daily_data["offense"] = day_log["attack"]
-            daily_data["defense"] = day_log["defense"]
+            await save_players_async(players)
 
-            # Only set start_trophies once after 10:30 AM
+            # === Update seasonal segment ===
             reset_time = now.replace(hour=10, minute=30, second=0, microsecond=0)
-            if now > reset_time and "start_trophies" not in daily_data:
-                daily_data["start_trophies"] = prev_trophies
-                print(f"[{name}] ✅ start_trophies set to {prev_trophies} at {now.strftime('%H:%M')}")
 
-            save_seasonal(seasonal_data)
+            def record_day(seasonal_data):
+                daily_data = seasonal_data.setdefault(tag, {}).setdefault(clash_day, {
+                    "offense": [],
+                    "defense": []
+                })
+                daily_data["offense"] = list(day_log["attack"])
+                daily_data["defense"] = list(day_log["defense"])
+
+                # Only set start_trophies once after 10:30 AM
+                if now > reset_time and "start_trophies" not in daily_data:
+                    daily_data["start_trophies"] = prev_trophies
+                    return True
+                return False
+
+            if await update_seasonal_async(record_day, season_for_clash_day(clash_day)):
+                print(f"[{name}] ✅ start_trophies set to {prev_trophies} at {now.strftime('%H:%M')}")
 
             # === Update prev_trophies
-            prev_data[name] = trophies
-            save_prev_trophies(prev_data)
+            prev_data[name] = snapshot
+            await save_prev_trophies_async(prev_data)
 
             # === Send Discord Embed
             embed = discord.Embed(
@@ -312,16 +1666,24 @@ async def monitor():
                 timestamp=datetime.now(timezone.utc)
             )
 
-            if delta > 0:
-                embed.add_field(name="⚔️ Offense Trophy Gain", value=f"`+{delta}`")
-            else:
-                embed.add_field(name="🛡️ Defense Trophy Loss", value=f"`-{abs_delta}`")
+            attack_hits = [t for kind, t in events if kind == "attack"]
+            defense_hits = [t for kind, t in events if kind == "defense"]
+            if attack_hits:
+                embed.add_field(name="⚔️ Offense Trophy Gain", value=" ".join(f"`+{t}`" for t in attack_hits))
+            if defense_hits:
+                embed.add_field(name="🛡️ Defense Trophy Loss", value=" ".join(f"`-{t}`" for t in defense_hits))
 
             embed.set_footer(text="Legend League Tracker")
             await channel.send(embed=embed)
 
     except Exception as e:
         print(f"[monitor] ❌ Error: {e}")
+    finally:
+        shutdown.busy.discard("monitor")
+        end_span(cycle_span)
+        elapsed = time.perf_counter() - cycle_started
+        MONITOR_CYCLE.observe(elapsed)
+        MONITOR_LAST_CYCLE.set(elapsed)
 
 # === SEARCH COMMAND ===
 @bot.command(name="search")
@@ -364,13 +1726,13 @@ async def handle_tag_search(ctx, tag):
             await ctx.send("❌ No player data found for this tag.")
             return
         
-        player_data = realtime_data["items"][0]  # First (and only) result
+        player = Player.from_todo(realtime_data["items"][0])  # First (and only) result
         
         # Build and send embed with real-time data
-        embed = await build_realtime_search_embed(player_data)
-        view = SearchView(ctx.author, tag, player_data.get("player_tag", f"#{tag}").replace("#", ""))
+        embed = await build_realtime_search_embed(player)
+        view = SearchView(ctx.author, tag, player.tag or tag)
         
-        await ctx.send(embed=embed, view=view)
+        await ctx.send(embed=mark_stale(embed), view=view)
         
     except Exception as e:
         logger.error(f"Tag search error: {e}")
@@ -398,7 +1760,7 @@ async def handle_name_search(ctx, name):
             # Multiple results, show selection
             embed = build_name_search_embed(items, name)
             view = NameSearchView(ctx.author, items, name)
-            await ctx.send(embed=embed, view=view)
+            await ctx.send(embed=mark_stale(embed), view=view)
             
     except Exception as e:
         logger.error(f"Name search error: {e}")
@@ -422,48 +1784,41 @@ async def show_tracked_player_stats(ctx, name, player_info):
     # Extract real-time data if available
     realtime_player = None
     if realtime_data and realtime_data.get("items"):
-        realtime_player = realtime_data["items"][0]
+        realtime_player = Player.from_todo(realtime_data["items"][0])
     
     # Build tracked player embed
     embed = await build_tracked_player_embed(coc_data, realtime_player, tag, name)
     view = TrackedPlayerView(ctx.author, tag, name)
     
-    await ctx.send(embed=embed, view=view)
+    await ctx.send(embed=mark_stale(embed), view=view)
 
-async def build_realtime_search_embed(player_data):
+@traced("embed.realtime_search")
+async def build_realtime_search_embed(player):
     """Build stats embed for searched player using real-time API data"""
-    player_tag = player_data.get("player_tag", "Unknown")
     name = "Unknown"
-    tag = player_tag.replace("#", "") if player_tag != "Unknown" else ""
+    tag = player.tag
     
     # Get today's date in IST
     today_ist = datetime.now(IST)
     today_str = today_ist.date().isoformat()
     
-    # Get legend data from the nested structure
-    legends_data = player_data.get("legends", {})
-    today_attacks = legends_data.get("attacks", [])
-    today_defenses = legends_data.get("defenses", [])
-    new_attacks = legends_data.get("new_attacks", [])
-    new_defenses = legends_data.get("new_defenses", [])
+    today = player.today
+    today_attacks = today.attacks
+    today_defenses = today.defenses
     
     # Calculate totals
-    today_offense_total = sum(today_attacks) if today_attacks else 0
-    today_defense_total = sum(today_defenses) if today_defenses else 0
-    today_net = today_offense_total - today_defense_total
+    today_offense_total = today.offense
+    today_defense_total = today.defense
+    today_net = today.net
     
     # Get current trophies from last attack or defense
-    current_trophies = 0
-    if new_attacks:
-        current_trophies = new_attacks[-1].get("trophies", 0)
-    elif new_defenses:
-        current_trophies = new_defenses[-1].get("trophies", 0)
+    current_trophies = today.current_trophies
     
     # Calculate start trophies from first attack
-    start_trophies = current_trophies - today_net if today_net != 0 else current_trophies
-    if new_attacks:
-        first_attack = new_attacks[0]
-        start_trophies = first_attack.get("trophies", 0) - first_attack.get("change", 0)
+    start_trophies = current_trophies - today_net
+    if today.new_attacks:
+        first_attack = today.new_attacks[0]
+        start_trophies = first_attack.trophies - first_attack.change
     
     # Try to get player name from COC API
     try:
@@ -506,13 +1861,10 @@ async def build_realtime_search_embed(player_data):
     embed.add_field(name="🛡️ Today's Defenses", value=defense_display, inline=False)
     
     # Hero Equipment Display
-    if new_attacks:
-        latest_attack = new_attacks[-1]
-        hero_gear = latest_attack.get("hero_gear", [])
-        
-        if hero_gear:
-            equipment_display = format_hero_equipment(hero_gear)
-            embed.add_field(name="⚔️ Hero Equipment", value=equipment_display, inline=False)
+    hero_gear = today.latest_gear
+    if hero_gear:
+        equipment_display = format_hero_equipment(hero_gear, tag)
+        embed.add_field(name="⚔️ Hero Equipment", value=equipment_display, inline=False)
     
     # Player link
     profile_link = f"https://link.clashofclans.com/en/?action=OpenPlayerProfile&tag=%23{tag}"
@@ -523,69 +1875,67 @@ async def build_realtime_search_embed(player_data):
     
     return embed
 
-def format_hero_equipment(hero_gear):
+def format_hero_equipment(hero_gear, tag=None):
     """Format hero equipment display with names and hero titles"""
     if not hero_gear:
         return "No equipment data"
     
-    # Group equipment by hero (assuming 2 per hero)
-    heroes = ["Barbarian King", "Archer Queen", "Grand Warden", "Royal Champion", "Minion Prince"]
-    hero_equipment = {}
-    
-    # Assign equipment to heroes (2 per hero)
-    for i in range(0, len(hero_gear), 2):
-        if i // 2 < len(heroes):
-            hero_name = heroes[i // 2]
-            equipment_pair = hero_gear[i:i+2]
-            hero_equipment[hero_name] = equipment_pair
-    
-    # Format display with hero names and equipment names
-    display_lines = []
-    for hero, equipment in hero_equipment.items():
-        if equipment:
-            hero_icons = {
-                "Barbarian King": "👑", 
-                "Archer Queen": "🏹", 
-                "Grand Warden": "🧙", 
-                "Royal Champion": "⚔️", 
-                "Minion Prince": "👾"
-            }
-            hero_icon = hero_icons.get(hero, "⚔️")
-            display_lines.append(f"**{hero_icon} {hero}:**")
-            
-            # Equipment names with levels
-            equip_strs = []
-            for equip in equipment:
-                name = equip.get("name", "Unknown")
-                level = equip.get("level", 0)
-                equip_strs.append(f"• {name} (Lv.{level})")
-            
-            display_lines.extend(equip_strs)
+    def build():
+        display_lines = []
+        for hero, equipment in hero_table.group(hero_gear):
+            display_lines.append(f"**{hero_table.icons.get(hero, '🧰')} {hero}:**")
+            display_lines.extend(f"• {equip.get('name', 'Unknown')} (Lv.{equip.get('level', 0)})" for equip in equipment)
             display_lines.append("")  # Empty line between heroes
-    
-    return "\n".join(display_lines).strip() if display_lines else "No equipment data"
-
+        return "\n".join(display_lines).strip() if display_lines else "No equipment data"
+    
+    if tag is None:
+        return build()
+    return cached_gear_block("search", tag, gear_signature(hero_gear), build)
+
+def format_stats_gear(tag, hero_gear, hero_levels):
+    """(title, lines) per hero for -stats, with the hero's level in the title"""
+    def build():
+        fields = []
+        for hero, equipment in hero_table.group(hero_gear):
+            label = f"{hero_table.stats_icons.get(hero, '🧰')} {hero}"
+            level = hero_levels.get(hero)
+            title = f"{label} (Lv. {level})" if level else label
+            fields.append((title, [f"{gear['name']} (Lv. {gear['level']})" for gear in equipment]))
+        return fields
+    
+    signature = (gear_signature(hero_gear), tuple(sorted(hero_levels.items())))
+    return cached_gear_block("stats", tag, signature, build)
+
+@traced("embed.tracked_player")
 async def build_tracked_player_embed(coc_data, realtime_player, tag, name):
     """Build embed for tracked player combining local and real-time data"""
     current_trophies = coc_data.get("trophies", "N/A")
-    
-    embed = discord.Embed(title=f"🏰 {name} (Tracked)", color=0x00ff00)
+    hero_table.learn(coc_data)
     
     # Get today's local data
     today_str = get_current_clash_day()
     legend_log = players.get(name, {}).get("legend_log", {}).get(today_str, {})
     
+    # Get start trophies from seasonal data
+    seasonal_data = await load_seasonal_async(season_for_clash_day(today_str))
+    today_data = seasonal_data.get(tag, {}).get(today_str, {})
+    start_trophies = today_data.get("start_trophies", "—")
+    
+    cache_key = embed_cache_key(
+        "tracked_player", current_trophies, realtime_player, tag, name, legend_log, start_trophies
+    )
+    cached = get_cached_embed(cache_key)
+    if cached is not None:
+        return cached
+    
+    embed = discord.Embed(title=f"🏰 {name} (Tracked)", color=0x00ff00)
+    
     attack_list = legend_log.get("attack", [])
     defense_list = legend_log.get("defense", [])
     attack_total = sum(attack_list)
     defense_total = sum(defense_list)
     trophy_net = attack_total - defense_total
     
-    # Get start trophies from seasonal data
-    seasonal_data = load_seasonal()
-    today_data = seasonal_data.get(tag, {}).get(today_str, {})
-    start_trophies = today_data.get("start_trophies", "—")
-    
     embed.add_field(name="🏆 Current Trophies", value=f"`{current_trophies}`", inline=True)
     embed.add_field(name="🏁 Start Trophies", value=f"`{start_trophies}`", inline=True)
     embed.add_field(name="📊 Net Today", value=f"`{trophy_net:+}`", inline=True)
@@ -608,29 +1958,20 @@ async def build_tracked_player_embed(coc_data, realtime_player, tag, name):
     
     # Real-time comparison (if available)
     if realtime_player:
-        legends_data = realtime_player.get("legends", {})
-        rt_attacks = legends_data.get("attacks", [])
-        rt_defenses = legends_data.get("defenses", [])
-        new_attacks = legends_data.get("new_attacks", [])
-        
-        rt_offense_total = sum(rt_attacks) if rt_attacks else 0
-        rt_defense_total = sum(rt_defenses) if rt_defenses else 0
+        rt_today = realtime_player.today
         
-        if rt_offense_total > 0 or rt_defense_total > 0:
+        if rt_today.offense > 0 or rt_today.defense > 0:
             embed.add_field(
                 name="📡 Real-time Comparison",
-                value=f"⚔️ `+{rt_offense_total}` ({len(rt_attacks)} hits) | 🛡️ `-{rt_defense_total}` ({len(rt_defenses)} hits)",
+                value=f"⚔️ `+{rt_today.offense}` ({len(rt_today.attacks)} hits) | 🛡️ `-{rt_today.defense}` ({len(rt_today.defenses)} hits)",
                 inline=False
             )
         
         # Hero Equipment Display from real-time data
-        if new_attacks:
-            latest_attack = new_attacks[-1]
-            hero_gear = latest_attack.get("hero_gear", [])
-            
-            if hero_gear:
-                equipment_display = format_hero_equipment(hero_gear)
-                embed.add_field(name="⚔️ Hero Equipment", value=equipment_display, inline=False)
+        hero_gear = rt_today.latest_gear
+        if hero_gear:
+            equipment_display = format_hero_equipment(hero_gear, tag)
+            embed.add_field(name="⚔️ Hero Equipment", value=equipment_display, inline=False)
     
     profile_link = f"https://link.clashofclans.com/en/?action=OpenPlayerProfile&tag=%23{tag}"
     embed.add_field(name="🔗 Player Link", value=f"[Open in Clash of Clans]({profile_link})", inline=False)
@@ -638,10 +1979,16 @@ async def build_tracked_player_embed(coc_data, realtime_player, tag, name):
     embed.set_footer(text=f"Tag: #{tag}")
     embed.timestamp = datetime.now()
     
-    return embed
+    return store_cached_embed(cache_key, embed)
 
+@traced("embed.name_search")
 def build_name_search_embed(items, search_name):
     """Build embed for name search results"""
+    cache_key = embed_cache_key("name_search", items[:15], search_name, len(items))
+    cached = get_cached_embed(cache_key)
+    if cached is not None:
+        return cached
+    
     embed = discord.Embed(
         title=f"🔍 Search Results for '{search_name}'",
         description=f"Found {len(items)} players. Select one to view stats:",
@@ -665,7 +2012,7 @@ def build_name_search_embed(items, search_name):
             inline=True
         )
     
-    return embed
+    return store_cached_embed(cache_key, embed)
 
 # === VIEW CLASSES ===
 class SearchView(discord.ui.View):
@@ -784,13 +2131,13 @@ class PlayerSelect(discord.ui.Select):
             await interaction.followup.send("❌ No real-time data found for this player.")
             return
         
-        player_data = realtime_data["items"][0]
+        player = Player.from_todo(realtime_data["items"][0])
         
         # Build and send embed
-        embed = await build_realtime_search_embed(player_data)
-        view = SearchView(self.author, tag, player_data.get("player_tag", f"#{tag}").replace("#", ""))
+        embed = await build_realtime_search_embed(player)
+        view = SearchView(self.author, tag, player.tag or tag)
         
-        await interaction.followup.send(embed=embed, view=view)
+        await interaction.followup.send(embed=mark_stale(embed), view=view)
 
 class HistoricalView(discord.ui.View):
     """View for historical month selection with unique custom_ids"""
@@ -857,22 +2204,23 @@ class HistoricalView(discord.ui.View):
             return
         
         # Build historical embed
-        embed = await build_historical_embed(legend_data, month_str)
-        view = DailyView(self.author, self.tag, self.player_name, month_str, legend_data)
+        player = Player.from_legends(legend_data)
+        embed = await build_historical_embed(player, month_str)
+        view = DailyView(self.author, self.tag, self.player_name, month_str, player)
         
-        await interaction.followup.send(embed=embed, view=view)
+        await interaction.followup.send(embed=mark_stale(embed), view=view)
 
 class DailyView(discord.ui.View):
     """Updated view for daily navigation within a month with unique button IDs"""
     
-    def __init__(self, author, tag, player_name, month_str, legend_data):
+    def __init__(self, author, tag, player_name, month_str, player):
         super().__init__(timeout=300)
         self.author = author
         self.tag = tag
         self.player_name = player_name
         self.month_str = month_str
-        self.legend_data = legend_data
-        self.dates = sorted(legend_data.get("legends", {}).keys())
+        self.player = player
+        self.dates = player.dates
         self.current_index = 0
         self.interaction_count = 0
         self.update_buttons()
@@ -950,31 +2298,32 @@ class DailyView(discord.ui.View):
             return
         
         try:
-            embed = await build_historical_embed(self.legend_data, self.month_str)
+            embed = await build_historical_embed(self.player, self.month_str)
             # Create new DailyView to reset button states
-            view = DailyView(self.author, self.tag, self.player_name, self.month_str, self.legend_data)
+            view = DailyView(self.author, self.tag, self.player_name, self.month_str, self.player)
             
             await interaction.response.edit_message(embed=embed, view=view)
         except Exception as e:
             logger.error(f"Back to month error: {e}")
             await interaction.response.send_message("❌ Error loading month view.", ephemeral=True)
     
+    @traced("embed.daily")
     def build_daily_embed(self):
         """Build embed for specific day - show complete attack/defense lists"""
         if not self.dates:
             return discord.Embed(title="No Data", description="No daily data available", color=0xff0000)
         
         current_date = self.dates[self.current_index]
-        day_data = self.legend_data["legends"][current_date]
+        day = self.player.days[current_date]
         
-        attacks = day_data.get("attacks", [])
-        defenses = day_data.get("defenses", [])
-        new_attacks = day_data.get("new_attacks", [])
-        new_defenses = day_data.get("new_defenses", [])
+        attacks = day.attacks
+        defenses = day.defenses
+        new_attacks = day.new_attacks
+        new_defenses = day.new_defenses
         
-        total_offense = sum(attacks)
-        total_defense = sum(defenses)
-        net_gain = total_offense - total_defense
+        total_offense = day.offense
+        total_defense = day.defense
+        net_gain = day.net
         
         embed = discord.Embed(
             title=f"📅 Daily Stats — {self.player_name}",
@@ -983,16 +2332,7 @@ class DailyView(discord.ui.View):
         )
         
         # Get initial trophy (lowest trophy from attacks)
-        initial_trophy = None
-        if new_attacks:
-            trophy_values = []
-            for attack in new_attacks:
-                current_trophy = attack.get("trophies", 0)
-                change = attack.get("change", 0)
-                initial = current_trophy - change
-                trophy_values.append(initial)
-            if trophy_values:
-                initial_trophy = min(trophy_values)
+        initial_trophy = day.initial_trophies
         
         if initial_trophy:
             embed.add_field(name="🏁 Initial Trophies", value=f"`{initial_trophy:,}`", inline=True)
@@ -1007,10 +2347,9 @@ class DailyView(discord.ui.View):
         if new_attacks:
             attack_details = []
             for attack in new_attacks:
-                timestamp = attack.get("time", 0)
-                change = attack.get("change", 0)
-                trophies = attack.get("trophies", 0)
-                time_str = datetime.fromtimestamp(timestamp).strftime("%H:%M")
+                change = attack.change
+                trophies = attack.trophies
+                time_str = datetime.fromtimestamp(attack.time).strftime("%H:%M")
                 attack_details.append(f"`{time_str}` +{change} → {trophies:,}")
             
             # Split into multiple fields if too long
@@ -1037,10 +2376,9 @@ class DailyView(discord.ui.View):
         if new_defenses:
             defense_details = []
             for defense in new_defenses:
-                timestamp = defense.get("time", 0)
-                change = defense.get("change", 0)
-                trophies = defense.get("trophies", 0)
-                time_str = datetime.fromtimestamp(timestamp).strftime("%H:%M")
+                change = defense.change
+                trophies = defense.trophies
+                time_str = datetime.fromtimestamp(defense.time).strftime("%H:%M")
                 defense_details.append(f"`{time_str}` -{change} → {trophies:,}")
             
             # Split into multiple fields if too long
@@ -1068,10 +2406,16 @@ class DailyView(discord.ui.View):
         
         return embed
 
-async def build_historical_embed(legend_data, month_str):
+@traced("embed.historical")
+async def build_historical_embed(player, month_str):
     """Build embed for historical month view"""
-    name = legend_data.get("name", "Unknown")
-    tag = legend_data.get("tag", "").replace("#", "")
+    cache_key = embed_cache_key("historical", player, month_str)
+    cached = get_cached_embed(cache_key)
+    if cached is not None:
+        return cached
+    
+    name = player.name
+    tag = player.tag
     
     # Parse month name
     try:
@@ -1080,55 +2424,36 @@ async def build_historical_embed(legend_data, month_str):
     except:
         month_display = month_str
     
-    legends = legend_data.get("legends", {})
-    
     embed = discord.Embed(
         title=f"📅 {month_display} — {name}",
         description=f"Monthly legend league performance",
         color=0x9B59B6
     )
     
-    total_offense = total_defense = total_days = 0
+    summary = SeasonSummary(player.days.values())
+    total_offense = summary.total_offense
+    total_defense = summary.total_defense
+    total_days = len(summary.days)
     daily_summaries = []
     
-    for date in sorted(legends.keys()):
-        day_data = legends[date]
-        attacks = day_data.get("attacks", [])
-        defenses = day_data.get("defenses", [])
-        
-        day_offense = sum(attacks)
-        day_defense = sum(defenses)
-        day_net = day_offense - day_defense
-        
-        total_offense += day_offense
-        total_defense += day_defense
-        total_days += 1
-        
+    for day in summary.days:
         # Get initial trophy
         initial_trophy = "—"
-        new_attacks = day_data.get("new_attacks", [])
-        if new_attacks:
-            trophy_values = []
-            for attack in new_attacks:
-                current_trophy = attack.get("trophies", 0)
-                change = attack.get("change", 0)
-                initial = current_trophy - change
-                trophy_values.append(initial)
-            if trophy_values:
-                initial_trophy = f"{min(trophy_values):,}"
+        if day.initial_trophies is not None:
+            initial_trophy = f"{day.initial_trophies:,}"
         
         daily_summaries.append({
-            "date": date,
+            "date": day.date,
             "initial": initial_trophy,
-            "offense": day_offense,
-            "defense": day_defense,
-            "net": day_net,
-            "attacks": len(attacks),
-            "defenses": len(defenses)
+            "offense": day.offense,
+            "defense": day.defense,
+            "net": day.net,
+            "attacks": len(day.attacks),
+            "defenses": len(day.defenses)
         })
     
     # Show summary
-    net_total = total_offense - total_defense
+    net_total = summary.net
     avg_offense = total_offense / max(total_days, 1)
     avg_defense = total_defense / max(total_days, 1)
     
@@ -1163,7 +2488,7 @@ async def build_historical_embed(legend_data, month_str):
     embed.set_footer(text=f"Tag: #{tag} | Use buttons to navigate daily details")
     embed.timestamp = datetime.now()
     
-    return embed
+    return store_cached_embed(cache_key, embed)
 
 async def export_player_data(interaction, tag, player_name):
     """Export player data to CSV"""
@@ -1180,7 +2505,7 @@ async def export_player_data(interaction, tag, player_name):
             
             legend_data = await fetch_api(f"/player/%23{tag}/legends", {"season": month_str})
             if legend_data and "legends" in legend_data:
-                months_data.append((month_str, legend_data["legends"]))
+                months_data.append((month_str, Player.from_legends(legend_data)))
         
         if not months_data:
             await interaction.followup.send("❌ No data available for export.")
@@ -1197,30 +2522,18 @@ async def export_player_data(interaction, tag, player_name):
         ])
         
         # Write data
-        for month_str, legends in months_data:
-            for date, day_data in sorted(legends.items()):
-                attacks = day_data.get("attacks", [])
-                defenses = day_data.get("defenses", [])
-                new_attacks = day_data.get("new_attacks", [])
-                
-                # Calculate initial trophy
-                initial_trophy = ""
-                if new_attacks:
-                    trophy_values = []
-                    for attack in new_attacks:
-                        current_trophy = attack.get("trophies", 0)
-                        change = attack.get("change", 0)
-                        initial = current_trophy - change
-                        trophy_values.append(initial)
-                    if trophy_values:
-                        initial_trophy = min(trophy_values)
+        for month_str, player in months_data:
+            for date, day in player.days.items():
+                initial_trophy = day.initial_trophies
+                if initial_trophy is None:
+                    initial_trophy = ""
                 
-                attack_details = ", ".join(map(str, attacks))
-                defense_details = ", ".join(map(str, defenses))
+                attack_details = ", ".join(map(str, day.attacks))
+                defense_details = ", ".join(map(str, day.defenses))
                 
                 writer.writerow([
-                    date, month_str, initial_trophy, len(attacks), sum(attacks),
-                    len(defenses), sum(defenses), sum(attacks) - sum(defenses),
+                    date, month_str, initial_trophy, len(day.attacks), day.offense,
+                    len(day.defenses), day.defense, day.net,
                     attack_details, defense_details
                 ])
         
@@ -1287,7 +2600,7 @@ async def stats(ctx, identifier: str = None):
     trophy_net = attack_total - defense_total
 
     # Fetch Initial Trophies
-    seasonal_data = load_seasonal()
+    seasonal_data = await load_seasonal_async(season_for_clash_day(today_str))
     start_trophies = "—"
     player_seasonal = seasonal_data.get(tag, {})
     today_data = player_seasonal.get(today_str, {})
@@ -1298,38 +2611,14 @@ async def stats(ctx, identifier: str = None):
     try:
         gear_data = await fetch_api(f"/player/to-do", {"player_tags": f"%23{tag}"})
         if gear_data and gear_data.get("items"):
-            legends_data = gear_data["items"][0].get("legends", {})
-            new_attacks = legends_data.get("new_attacks", [])
-            if new_attacks:
-                hero_gear_raw = new_attacks[-1].get("hero_gear", [])
+            hero_gear_raw = Player.from_todo(gear_data["items"][0]).today.latest_gear
     except:
         pass
 
     # Hero levels from coc_data
-    hero_levels = {h['name']: h['level'] for h in coc_data.get("heroes", [])}
-
-    heroes = {
-        "👑 Barbarian King": [],
-        "👸 Archer Queen": [],
-        "🧚 Grand Warden": [],
-        "🎯 Royal Champion": [],
-        "👹 Minion Prince": []
-    }
-    hero_order = list(heroes.keys())
-    hero_names = ["Barbarian King", "Archer Queen", "Grand Warden", "Royal Champion", "Minion Prince"]
-
-    for i in range(0, len(hero_gear_raw), 2):
-        hero_icon = hero_order[i // 2] if i // 2 < len(hero_order) else None
-        hero_name = hero_names[i // 2] if i // 2 < len(hero_names) else None
-        if hero_icon and hero_name:
-            level = hero_levels.get(hero_name)
-            hero_title = f"{hero_icon} (Lv. {level})" if level else hero_icon
-            gears = []
-            for gear in hero_gear_raw[i:i+2]:
-                gname = gear["name"]
-                glevel = gear["level"]
-                gears.append(f"{gname} (Lv. {glevel})")
-            heroes[hero_title] = gears
+    hero_table.learn(coc_data)
+    hero_levels = {h['name']: h['level'] for h in coc_data.get("heroes", []) if h.get('name') in hero_table.icons}
+    gear_fields = format_stats_gear(tag, hero_gear_raw, hero_levels)
 
     atk_hit_str = " ".join(f"+{v}" for v in attack_list) if attack_list else "None"
     def_hit_str = " ".join(f"-{v}" for v in defense_list) if defense_list else "None"
@@ -1343,11 +2632,10 @@ async def stats(ctx, identifier: str = None):
     embed.add_field(name="⚔️ Attacks", value=f"{atk_hit_str} ({len(attack_list)} hits)\n**Total**: +{attack_total}", inline=False)
     embed.add_field(name="🛡️ Defenses", value=f"{def_hit_str} ({len(defense_list)} hits)\n**Total**: -{defense_total}", inline=False)
 
-    for hero_title, gear_list in heroes.items():
-        if gear_list:
-            embed.add_field(name=hero_title, value="\n".join(gear_list), inline=False)
+    for hero_title, gear_list in gear_fields:
+        embed.add_field(name=hero_title, value="\n".join(gear_list), inline=False)
 
-    if not any(heroes.values()):
+    if not gear_fields:
         embed.add_field(name="🧰 Hero Gear", value="⚠️ No gear data found.", inline=False)
 
     if clan_name and clan_tag:
@@ -1382,41 +2670,28 @@ async def stats(ctx, identifier: str = None):
             await interaction.response.send_message("⚠️ Only the command user can use this button.", ephemeral=True)
             return
 
-        seasonal_data = load_seasonal()
+        seasonal_data = await load_seasonal_async()
         player_logs = seasonal_data.get(tag, {})
         if not player_logs:
             await interaction.response.send_message("📦 No seasonal log available for this player.", ephemeral=True)
             return
 
         embed_logs = discord.Embed(title=f"📜 Daily Logs — {name}", color=0x00ffcc)
-        atk_total_all = def_total_all = days = 0
-
-        for date in sorted(player_logs.keys()):
-            log = player_logs[date]
-            offense = log.get("offense", [])
-            defense = log.get("defense", [])
-            start_trophies = log.get("start_trophies", None)
-
-            atk_total = sum(offense)
-            def_total = sum(defense)
-            net = atk_total - def_total
-            atk_hits = len(offense)
-            def_hits = len(defense)
+        summary = SeasonSummary.from_seasonal(player_logs)
 
+        for day in summary.days:
             log_line = (
-                f"🏁 `{start_trophies or '—'}` | "
-                f"⚔️ `+{atk_total}` ({atk_hits}) | "
-                f"🛡️ `-{def_total}` ({def_hits}) | "
-                f"📊 `Net: {net:+}`"
+                f"🏁 `{day.start_trophies or '—'}` | "
+                f"⚔️ `+{day.offense}` ({len(day.attacks)}) | "
+                f"🛡️ `-{day.defense}` ({len(day.defenses)}) | "
+                f"📊 `Net: {day.net:+}`"
             )
 
-            embed_logs.add_field(name=f"🗓️ {date}", value=log_line, inline=False)
-            atk_total_all += atk_total
-            def_total_all += def_total
-            days += 1
+            embed_logs.add_field(name=f"🗓️ {day.date}", value=log_line, inline=False)
 
-        avg_atk = round(atk_total_all / days, 1) if days else 0
-        avg_def = round(def_total_all / days, 1) if days else 0
+        days = len(summary.days)
+        avg_atk = round(summary.total_offense / days, 1) if days else 0
+        avg_def = round(summary.total_defense / days, 1) if days else 0
         embed_logs.set_footer(text=f"📆 Total Days: {days} | Avg Offense: +{avg_atk} | Avg Defense: -{avg_def}")
 
         await interaction.response.send_message(embed=embed_logs, ephemeral=False)
@@ -1425,7 +2700,7 @@ async def stats(ctx, identifier: str = None):
     button.callback = show_logs_callback
     view.add_item(button)
 
-    await ctx.send(embed=embed, view=view)
+    await ctx.send(embed=mark_stale(embed), view=view)
 
 @bot.command(name="localrank")
 async def localrank(ctx, country: str = None, limit: int = 10):
@@ -1499,6 +2774,17 @@ async def eos(ctx, player_name: str = None, count: int = 5):
         await ctx.send("❌ Failed to fetch end-of-season data.")
         return
 
+    embed = build_eos_embed(data, player_name, count, tag)
+    await ctx.send(embed=mark_stale(embed))
+
+@traced("embed.eos")
+def build_eos_embed(data, player_name, count, tag):
+    """Build embed for end-of-season rankings"""
+    cache_key = embed_cache_key("eos", data[:count], player_name.title(), count, tag)
+    cached = get_cached_embed(cache_key)
+    if cached is not None:
+        return cached
+
     embed = discord.Embed(
         title=f"📅 End of Season Stats — {player_name.title()}",
         description=f"Showing last `{count}` seasons",
@@ -1524,7 +2810,7 @@ async def eos(ctx, player_name: str = None, count: int = 5):
 
     embed.set_footer(text=f"Tag: #{tag}")
 
-    await ctx.send(embed=embed)
+    return store_cached_embed(cache_key, embed)
 
 @bot.command(name="cutoff")
 async def cutoff(ctx):
@@ -1543,6 +2829,17 @@ async def cutoff(ctx):
         await ctx.send("⚠️ No cutoff data available.")
         return
 
+    embed = build_cutoff_embed(data)
+    await ctx.send(embed=mark_stale(embed))
+
+@traced("embed.cutoff")
+def build_cutoff_embed(data):
+    """Build embed for legend league trophy buckets"""
+    cache_key = embed_cache_key("cutoff", data)
+    cached = get_cached_embed(cache_key)
+    if cached is not None:
+        return cached
+
     embed = discord.Embed(
         title="📉 Legend League Trophy Cutoffs",
         description="Number of players in each trophy bucket.",
@@ -1564,7 +2861,7 @@ async def cutoff(ctx):
         )
 
     embed.set_footer(text="📊 Source: ClashKing — Trophy Distribution")
-    await ctx.send(embed=embed)
+    return store_cached_embed(cache_key, embed)
 
 @bot.command(name="addplayer")
 async def add_player(ctx, name: str, tag: str):
@@ -1574,14 +2871,14 @@ async def add_player(ctx, name: str, tag: str):
         "legend": {"attack": 0, "defense": 0},
         "last_reset_date": ""
     }
-    save_players(players)
+    await save_players_async(players)
     await ctx.send(f"✅ Added **{name}** with tag `#{tag}`")
 
 @bot.command(name="removeplayer")
 async def remove_player(ctx, name: str):
     if name in players:
         del players[name]
-        save_players(players)
+        await save_players_async(players)
         await ctx.send(f"🗑️ Removed player **{name}**")
     else:
         await ctx.send(f"⚠️ Player **{name}** not found.")
@@ -1652,7 +2949,7 @@ async def leaderboard(ctx):
             inline=False
         )
 
-    await ctx.send(embed=leaderboard_embed)
+    await ctx.send(embed=mark_stale(leaderboard_embed))
 
     # === GLOBAL STATS ===
     global_data = await fetch_api("/global/counts")
@@ -1672,7 +2969,7 @@ async def leaderboard(ctx):
         global_embed.add_field(name="🎯 Clans in War", value=fmt(global_data.get("clans_in_war")), inline=True)
         global_embed.add_field(name="📦 Wars Stored", value=fmt(global_data.get("wars_stored")), inline=True)
         global_embed.add_field(name="🔁 Join/Leaves", value=fmt(global_data.get("total_join_leaves")), inline=False)
-        await ctx.send(embed=global_embed)
+        await ctx.send(embed=mark_stale(global_embed))
     else:
         await ctx.send("⚠️ Failed to fetch global stats.")
 
@@ -1698,7 +2995,7 @@ async def attack_patterns(ctx, player_name: str = None):
     tag = player_data["tag"]
     
     # Load seasonal data for pattern analysis
-    seasonal_data = load_seasonal()
+    seasonal_data = await load_seasonal_async()
     player_seasonal = seasonal_data.get(tag, {})
     
     if not player_seasonal:
@@ -1714,71 +3011,28 @@ async def attack_patterns(ctx, player_name: str = None):
 
     # Initialize pattern tracking variables
     daily_activity = {"Monday": 0, "Tuesday": 0, "Wednesday": 0, "Thursday": 0, "Friday": 0, "Saturday": 0, "Sunday": 0}
-    total_attacks = 0
-    total_defenses = 0
-    total_offense = 0
-    total_defense_loss = 0
-    best_day_performance = {"day": "", "net": -999, "offense": 0, "defense": 0}
-    worst_day_performance = {"day": "", "net": 999, "offense": 0, "defense": 0}
-    
-    # Analyze each day's data
-    daily_stats = []
-    active_days = 0
-    
-    for day in all_days:
-        day_data = player_seasonal.get(day, {})
-        offense = day_data.get("offense", [])
-        defense = day_data.get("defense", [])
-        start_trophies = day_data.get("start_trophies", 0)
-        
-        day_attacks = len(offense)
-        day_defenses = len(defense)
-        day_offense_total = sum(offense)
-        day_defense_total = sum(defense)
-        day_net = day_offense_total - day_defense_total
-        
-        # Only count days with activity
-        if day_attacks > 0 or day_defenses > 0:
-            active_days += 1
-            
-        total_attacks += day_attacks
-        total_defenses += day_defenses
-        total_offense += day_offense_total
-        total_defense_loss += day_defense_total
-        
-        # Track best/worst days
-        if day_net > best_day_performance["net"]:
-            best_day_performance = {
-                "day": day, 
-                "net": day_net, 
-                "offense": day_offense_total, 
-                "defense": day_defense_total
-            }
-        if day_net < worst_day_performance["net"]:
-            worst_day_performance = {
-                "day": day, 
-                "net": day_net, 
-                "offense": day_offense_total, 
-                "defense": day_defense_total
-            }
-        
-        # Get day of week
+    summary = SeasonSummary.from_seasonal(player_seasonal)
+    total_attacks = summary.attack_count
+    total_defenses = summary.defense_count
+    total_offense = summary.total_offense
+    total_defense_loss = summary.total_defense
+    active_days = summary.active_days
+    best_day_performance = {
+        "day": summary.best_day.date, "net": summary.best_day.net,
+        "offense": summary.best_day.offense, "defense": summary.best_day.defense
+    }
+    worst_day_performance = {
+        "day": summary.worst_day.date, "net": summary.worst_day.net,
+        "offense": summary.worst_day.offense, "defense": summary.worst_day.defense
+    }
+    
+    # Attacks per day of week
+    for day in summary.days:
         try:
-            date_obj = datetime.strptime(day, "%Y-%m-%d")
-            day_name = date_obj.strftime("%A")
-            daily_activity[day_name] += day_attacks
+            date_obj = datetime.strptime(day.date, "%Y-%m-%d")
+            daily_activity[date_obj.strftime("%A")] += len(day.attacks)
         except:
             pass
-        
-        daily_stats.append({
-            "day": day,
-            "attacks": day_attacks,
-            "defenses": day_defenses,
-            "offense": day_offense_total,
-            "defense": day_defense_total,
-            "net": day_net,
-            "start_trophies": start_trophies
-        })
 
     if total_attacks == 0 and total_defenses == 0:
         await ctx.send("📭 No activity data found for pattern analysis.")
@@ -1799,9 +3053,7 @@ async def attack_patterns(ctx, player_name: str = None):
     defense_efficiency = round(total_defense_loss / max(total_defenses, 1), 1)
     
     # Find streaks and patterns
-    attack_days = sum(1 for stat in daily_stats if stat["attacks"] > 0)
-    defense_days = sum(1 for stat in daily_stats if stat["defenses"] > 0)
-    inactive_days = sum(1 for stat in daily_stats if stat["attacks"] == 0 and stat["defenses"] == 0)
+    inactive_days = len(summary.days) - active_days
     
     # Create comprehensive embed
     embed = discord.Embed(
@@ -1872,6 +3124,80 @@ async def attack_patterns(ctx, player_name: str = None):
 
     await ctx.send(embed=embed)
 
+@bot.command(name="iostats")
+@commands.has_permissions(administrator=True)
+async def iostats(ctx):
+    """Show event-loop blocking and persistence cost for the current mode"""
+    lag = loop_lag.summary()
+    mode = "worker threads" if ASYNC_PERSISTENCE else "inline on event loop"
+    per_call = store.loop_seconds / max(store.calls, 1) * 1000
+
+    embed = discord.Embed(title="🧮 I/O & Event Loop Stats", color=0x95A5A6)
+    embed.add_field(name="💾 Persistence", value=f"`{mode}`", inline=False)
+    embed.add_field(
+        name="⏱️ Loop Lag",
+        value=(
+            f"Max: `{lag['max_ms']:.1f}ms` | p99: `{lag['p99_ms']:.1f}ms` | Mean: `{lag['mean_ms']:.2f}ms`\n"
+            f"Blocked: `{lag['blocked_s']:.2f}s` over last {len(loop_lag.samples)} samples"
+        ),
+        inline=False
+    )
+    embed.add_field(
+        name="📂 Storage Calls",
+        value=f"`{store.calls}` calls | `{store.loop_seconds * 1000:.1f}ms` on loop | `{per_call:.2f}ms` per call",
+        inline=False
+    )
+    await ctx.send(embed=embed)
+
+@bot.command(name="reloadheroes")
+@commands.has_permissions(administrator=True)
+async def reload_heroes(ctx):
+    """Re-read heroes.json into the hero/equipment table"""
+    await store.run(hero_table.load)
+    await ctx.send(f"✅ Hero table reloaded: `{len(hero_table.order)}` heroes, `{len(hero_table.equipment_hero)}` equipment.")
+
+@bot.command(name="perf")
+@commands.has_permissions(administrator=True)
+async def perf(ctx, limit: int = 10):
+    """Summarize the slowest recent spans"""
+    if not TRACING_ENABLED:
+        await ctx.send("⚠️ Tracing is off. Set `TRACING_ENABLED = True` to record spans.")
+        return
+    spans = list(recent_spans)
+    if not spans:
+        await ctx.send("📭 No spans recorded yet.")
+        return
+
+    limit = max(1, min(limit, 12))
+    embed = discord.Embed(
+        title="⏱️ Slowest Recent Spans",
+        description=f"From the last `{len(spans)}` spans",
+        color=0xE67E22
+    )
+
+    slowest = sorted(spans, key=lambda sp: sp.duration_ms, reverse=True)[:limit]
+    embed.add_field(
+        name="🐢 Slowest",
+        value="\n".join(
+            f"`{sp.duration_ms:8.1f}ms` {sp.name}"
+            + (f" `{sp.attributes['endpoint']}`" if "endpoint" in sp.attributes else "")
+            for sp in slowest
+        ),
+        inline=False
+    )
+
+    by_name = {}
+    for sp in spans:
+        by_name.setdefault(sp.name, []).append(sp.duration_ms)
+    summary_lines = []
+    for span_name, durations in sorted(by_name.items(), key=lambda kv: max(kv[1]), reverse=True)[:limit]:
+        durations.sort()
+        p50 = durations[len(durations) // 2]
+        summary_lines.append(f"{span_name}: `{len(durations)}x` p50 `{p50:.1f}ms` max `{durations[-1]:.1f}ms`")
+    embed.add_field(name="📊 By Span", value="\n".join(summary_lines), inline=False)
+
+    await ctx.send(embed=embed)
+
 @bot.command(name="helpme", aliases=["commands", "cmds"])
 async def custom_help(ctx):
     embed = discord.Embed(
@@ -1952,14 +3278,34 @@ async def custom_help(ctx):
     embed.set_thumbnail(url="https://cdn-icons-png.flaticon.com/512/3305/3305803.png")
     await ctx.send(embed=embed)
 
+# === COMMAND TIMING ===
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.command_started = time.perf_counter()
+    ctx.command_span = start_span(f"command.{ctx.command.qualified_name}", user=str(ctx.author.id))
+    # Shared with any fetches the command gathers concurrently
+    stale_reads.set([])
+
+@bot.after_invoke
+async def record_command_latency(ctx):
+    end_span(getattr(ctx, "command_span", None))
+    started = getattr(ctx, "command_started", None)
+    if started is not None:
+        COMMAND_LATENCY.observe(time.perf_counter() - started, command=ctx.command.qualified_name)
+    if ctx.command_failed:
+        COMMAND_ERRORS.inc(command=ctx.command.qualified_name)
+
 # === ERROR HANDLER FOR UNKNOWN COMMANDS ===
 @bot.event
 async def on_command_error(ctx, error):
-    if isinstance(error, commands.CommandNotFound):
+    if isinstance(error, ShuttingDown):
+        await ctx.send("🛑 The bot is restarting, try again in a minute.")
+    elif isinstance(error, commands.CommandNotFound):
         await ctx.send("⚠️ Unknown command! Use `-helpme` to see all available commands.")
     else:
         logger.error(f"Command error: {error}")
         await ctx.send("❌ An error occurred while processing the command.")
 
 # === RUN ===
-bot.run(TOKEN)
\ No newline at end of file
+if __name__ == "__main__":
+    bot.run(TOKEN)
\ No newline at end of file
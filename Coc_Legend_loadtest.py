@@ -0,0 +1,210 @@
+"""Replay-based load generator for Coc_Legend_bot command traffic.
+
+Feeds -search / -stats invocations and button clicks on the result views
+straight into the bot's handlers, with Discord mocked out and the upstream
+APIs served by the benchmark stub. Reports throughput and tail latency per
+command at each concurrency level.
+
+    python Coc_Legend_loadtest.py --concurrency 1,8,32,128 --requests 400
+    python Coc_Legend_loadtest.py --replay traffic.jsonl
+
+A replay file holds one JSON object per line, e.g.
+    {"kind": "search", "arg": "#B000001"}
+    {"kind": "stats", "arg": "bench3"}
+    {"kind": "month_click", "arg": "bench3"}
+Kinds: search, stats, historical_click, month_click, next_day_click.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import random
+import tempfile
+import time
+
+from Coc_Legend_benchmark import (
+    FakeAuthor,
+    FakeContext,
+    FakeInteraction,
+    StubUpstream,
+    load_bot,
+    percentile,
+    point_at_stub,
+    seed_roster,
+)
+
+KINDS = ("search", "stats", "historical_click", "month_click", "next_day_click")
+DEFAULT_MIX = {"search": 4, "stats": 3, "historical_click": 1, "month_click": 1, "next_day_click": 1}
+
+class TrafficDriver:
+    """Turns traffic records into handler calls on the imported bot"""
+
+    def __init__(self, bot_module):
+        self.bot = bot_module
+        self.legend_data = {}
+        self.errors = {}
+
+    def tag_for(self, name):
+        return self.bot.players[name]["tag"]
+
+    async def legends_for(self, name):
+        # DailyView is built from a month already fetched by HistoricalView
+        if name not in self.legend_data:
+            month_str = self.bot.datetime.now(self.bot.IST).strftime("%Y-%m")
+            self.legend_data[name] = await self.bot.fetch_api(
+                f"/player/%23{self.tag_for(name)}/legends", {"season": month_str}
+            )
+        return self.legend_data[name]
+
+    async def dispatch(self, record, user_id):
+        kind, arg = record["kind"], record["arg"]
+        author = FakeAuthor(user_id)
+
+        if kind == "search":
+            ctx = FakeContext(user_id)
+            await self.bot.search_player.callback(ctx, query=arg)
+        elif kind == "stats":
+            ctx = FakeContext(user_id)
+            await self.bot.stats.callback(ctx, arg)
+        elif kind == "historical_click":
+            view = self.bot.TrackedPlayerView(author, self.tag_for(arg), arg)
+            await view.show_historical.callback(FakeInteraction(author))
+        elif kind == "month_click":
+            view = self.bot.HistoricalView(author, self.tag_for(arg), arg)
+            custom_id = next(iter(view.months_data))
+            await view.month_callback(FakeInteraction(author, custom_id))
+        elif kind == "next_day_click":
+            legend_data = await self.legends_for(arg)
+            month_str = self.bot.datetime.now(self.bot.IST).strftime("%Y-%m")
+            player = self.bot.Player.from_legends(legend_data or {"legends": {}})
+            view = self.bot.DailyView(author, self.tag_for(arg), arg, month_str, player)
+            await view.next_day(FakeInteraction(author))
+        else:
+            raise ValueError(f"Unknown traffic kind: {kind}")
+
+def synthetic_traffic(names, count, mix, seed=7):
+    """Draw `count` records from the weighted command mix"""
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    records = []
+    for _ in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        name = rng.choice(names)
+        arg = name if kind != "search" or rng.random() < 0.5 else f"#{name}"
+        records.append({"kind": kind, "arg": arg})
+    return records
+
+def load_replay(path, names):
+    """Read recorded traffic, mapping unknown player names onto the roster"""
+    records = []
+    with open(path) as f:
+        for i, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record["kind"] not in KINDS:
+                raise ValueError(f"{path}:{i + 1}: unknown kind {record['kind']!r}")
+            arg = record.get("arg", "")
+            if not arg.startswith("#") and arg not in names:
+                arg = names[i % len(names)]
+            records.append({"kind": record["kind"], "arg": arg})
+    return records
+
+async def run_level(driver, records, concurrency):
+    """Replay all records with at most `concurrency` in flight"""
+    latencies = {kind: [] for kind in KINDS}
+    errors = {kind: 0 for kind in KINDS}
+    queue = asyncio.Queue()
+    for i, record in enumerate(records):
+        queue.put_nowait((i, record))
+
+    async def worker():
+        while True:
+            try:
+                i, record = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                await driver.dispatch(record, user_id=1000 + i % 500)
+            except Exception:
+                errors[record["kind"]] += 1
+            latencies[record["kind"]].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return elapsed, latencies, errors
+
+def print_level(concurrency, elapsed, latencies, errors):
+    total = sum(len(v) for v in latencies.values())
+    print(f"\nconcurrency {concurrency}: {total} requests in {elapsed:.2f}s ({total / elapsed:.1f} req/s)")
+    print(f"  {'command':<18} | {'count':>5} | {'req/s':>7} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | {'errors':>6}")
+    for kind in KINDS:
+        samples = latencies[kind]
+        if not samples:
+            continue
+        print(
+            f"  {kind:<18} | {len(samples):>5} | {len(samples) / elapsed:>7.1f} | "
+            f"{percentile(samples, 50) * 1000:>8.1f} | {percentile(samples, 95) * 1000:>8.1f} | "
+            f"{percentile(samples, 99) * 1000:>8.1f} | {errors[kind]:>6}"
+        )
+
+async def main(args):
+    bot_module = load_bot(tempfile.mkdtemp(prefix="coc-load-"))
+    stub = StubUpstream(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, rate_429=args.rate_429)
+    point_at_stub(bot_module, await stub.start())
+    seed_roster(bot_module, args.roster)
+
+    names = list(bot_module.players)
+    records = load_replay(args.replay, names) if args.replay else synthetic_traffic(names, args.requests, DEFAULT_MIX)
+    driver = TrafficDriver(bot_module)
+
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            elapsed, latencies, errors = await run_level(driver, records, concurrency)
+            print_level(concurrency, elapsed, latencies, errors)
+            results.append({
+                "concurrency": concurrency,
+                "elapsed_s": elapsed,
+                "commands": {
+                    kind: {
+                        "count": len(samples),
+                        "p50_ms": percentile(samples, 50) * 1000,
+                        "p95_ms": percentile(samples, 95) * 1000,
+                        "p99_ms": percentile(samples, 99) * 1000,
+                        "errors": errors[kind]
+                    }
+                    for kind, samples in latencies.items() if samples
+                }
+            })
+    finally:
+        if bot_module.session and not bot_module.session.closed:
+            await bot_module.session.close()
+        await stub.stop()
+
+    print(f"\nStub served {stub.requests} requests ({stub.throttled} throttled with 429).")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=lambda v: [int(x) for x in v.split(",")], default=[1, 8, 32, 128],
+                        help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=400, help="Synthetic requests per level")
+    parser.add_argument("--replay", help="JSONL file of recorded traffic to replay instead")
+    parser.add_argument("--roster", type=int, default=50, help="Tracked players to seed")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Base stub latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Random extra latency per request")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
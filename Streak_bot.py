@@ -3,83 +3,765 @@ from discord.ext import commands, tasks
 from datetime import datetime, timedelta
 import json
 import asyncio
+import bisect
+import calendar
+import contextlib
+import heapq
 import os
+import signal
+import sqlite3
+import time
 import pytz
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 # Set these manually
 DISCORD_TOKEN = ""
+# Reminder channel and role of the server the bot served before it went multi-server.
+# That server keeps its reminders and existing streaks; other servers go in GUILDS_FILE.
 CHANNEL_ID = 1379153204838928404  # Replace with your channel ID
 ROLE_ID = 1379157676667179179     # Replace with your role ID
 
 IST = pytz.timezone("Asia/Kolkata")
-DATA_FILE = "streaks.json"
+# Per-server reminder channel, role, cutoff, time zone and trackers
+GUILDS_FILE = "guilds.json"
+# The tracker a server gets when it configures none, and the one legacy streaks belong to
+DEFAULT_TRACKER = "NoFap"
+# Placeholder guild id for single-server streaks until login reveals CHANNEL_ID's server
+LEGACY_PARTITION = "legacy"
+DATA_FILE = "streaks.json"  # Legacy store, imported into DB_FILE on first start
+DB_FILE = "streaks.db"  # Snapshot of all records, refreshed by compaction
+WAL_FILE = "streaks.wal"  # Mutations since the last compaction
+# A crash loses at most this much of the write-ahead log (the OS already has it after each write)
+WAL_FSYNC_SECONDS = 1
+# Fold the write-ahead log into the snapshot this often, or sooner once it holds this many entries
+COMPACT_MINUTES = 10
+COMPACT_WAL_ENTRIES = 5000
+LEADERBOARD_PAGE_SIZE = 10
+# Names fetched from Discord are reused for this long before being fetched again
+USERNAME_TTL_HOURS = 24
+# Optional per-guild rank ladders and milestones; RANKS and MILESTONES are the fallback
+RANKS_FILE = "ranks.json"
+# Run streak record and log I/O in a worker thread; False keeps it on the event loop for comparison
+ASYNC_PERSISTENCE = True
+# After a restart, still send a reminder whose cutoff passed at most this long ago
+REMINDER_GRACE_MINUTES = 30
+# The reminder scheduler rechecks the wall clock at least this often, in case it jumps
+REMINDER_MAX_SLEEP_SECONDS = 3600
+# How long SIGTERM waits for queued streak writes before exiting anyway
+SHUTDOWN_DEADLINE_SECONDS = 10
 
-if not os.path.exists(DATA_FILE):
-    with open(DATA_FILE, "w") as f:
-        json.dump({}, f)
+# === GUILD CONFIG ===
+EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+class GuildConfig:
+    """One server's reminder channel and role, daily cutoff, time zone and streak trackers.
+
+    Check-in windows run cutoff -> cutoff in the server's time zone and are
+    numbered by the local date they end on (days since 1970-01-01).
+    """
+
+    def __init__(self, channel_id=None, role_id=None, cutoff_hour=21, timezone="Asia/Kolkata", trackers=None):
+        self.channel_id = int(channel_id) if channel_id else None
+        self.role_id = int(role_id) if role_id else None
+        self.cutoff_hour = int(cutoff_hour)
+        if not 0 <= self.cutoff_hour <= 23:
+            raise ValueError(f"cutoff_hour must be 0-23, got {cutoff_hour}")
+        self.tz = pytz.timezone(timezone)
+        self.trackers = [str(name) for name in trackers or [DEFAULT_TRACKER]]
+        self.shift = timedelta(hours=(24 - self.cutoff_hour) % 24)
+        self.clock = WindowClock(self)
+
+    def now(self):
+        return datetime.now(self.tz)
+
+    def window_start(self, now):
+        """Most recent cutoff at or before the aware datetime now"""
+        local = now.astimezone(self.tz).replace(tzinfo=None)
+        cutoff = local.replace(hour=self.cutoff_hour, minute=0, second=0, microsecond=0)
+        if local < cutoff:
+            cutoff -= timedelta(days=1)
+        return self.tz.localize(cutoff)
+
+    def next_cutoff(self, now):
+        """First cutoff after the aware datetime now"""
+        return self.tz.localize(self.window_start(now).replace(tzinfo=None) + timedelta(days=1))
+
+    def window_day(self, timestamp):
+        return (datetime.fromtimestamp(timestamp, self.tz) + self.shift).toordinal() - EPOCH_ORDINAL
+
+    def cutoff_label(self):
+        return f"{self.cutoff_hour % 12 or 12} {'AM' if self.cutoff_hour < 12 else 'PM'}"
+
+    def tracker_name(self, name=None):
+        """Configured spelling of a tracker name (any case); the first tracker by default, None if unknown"""
+        if name is None:
+            return self.trackers[0]
+        return next((tracker for tracker in self.trackers if tracker.lower() == name.lower()), None)
+
+class WindowClock:
+    """A server's current check-in window, recomputed only once a cutoff passes.
+
+    current() is the hot path for check-ins and history stamps: between
+    cutoffs it is two integer comparisons, with no datetime or time zone work.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.window = (0, 0, 0)
+
+    def compute(self, now):
+        """(start, end, day) of the window containing epoch second now, without touching the cache"""
+        local = datetime.fromtimestamp(now, self.config.tz)
+        start = int(self.config.window_start(local).timestamp())
+        end = int(self.config.next_cutoff(local).timestamp())
+        return start, end, self.config.window_day(start)
+
+    def current(self, now=None):
+        """(start, end, day): window bounds in epoch seconds and its day number (see GuildConfig)"""
+        now = int(time.time()) if now is None else now
+        window = self.window  # One tuple, so the store worker and the event loop never see half an update
+        if not window[0] <= now < window[1]:
+            window = self.window = self.compute(now)
+        return window
+
+default_config = GuildConfig()
+guild_configs = {}
+# Server that owns CHANNEL_ID, known once logged in (see adopt_legacy_guild)
+legacy_guild_id = None
+
+def load_guild_configs(path=GUILDS_FILE):
+    """Read guilds.json: {"default" | "<guild id>": {"channel_id", "role_id", "cutoff_hour", "timezone", "trackers"}}.
+
+    Missing keys come from "default", then the built-in settings. The server that
+    owns CHANNEL_ID gets CHANNEL_ID and ROLE_ID unless the file lists it. A broken
+    file keeps the current configs.
+    """
+    global default_config, guild_configs
+    base = {}
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                config = json.load(f)
+            base = config.get("default", {})
+            configs = {
+                str(guild_id): GuildConfig(**{**base, **entry})
+                for guild_id, entry in config.items() if guild_id != "default"
+            }
+            base_config = GuildConfig(**base)
+            print(f"🌐 Loaded {len(configs)} server configs from {path}")
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+            print(f"⚠️ Could not load {path}, keeping current server configs: {e}")
+            return
+    else:
+        configs, base_config = {}, GuildConfig()
+    if legacy_guild_id and legacy_guild_id not in configs:
+        configs[legacy_guild_id] = GuildConfig(**{**base, "channel_id": CHANNEL_ID, "role_id": ROLE_ID})
+    default_config, guild_configs = base_config, configs
+
+def config_for(guild_id):
+    return guild_configs.get(str(guild_id), default_config)
+
+load_guild_configs()
+
+# === SNAPSHOT STORE ===
+# One connection, only ever used from the single store worker (or inline when ASYNC_PERSISTENCE is off)
+db = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None)
+db.execute("PRAGMA journal_mode=WAL")
+db.execute("PRAGMA synchronous=NORMAL")
+
+@contextlib.contextmanager
+def transaction():
+    """BEGIN IMMEDIATE ... COMMIT, rolled back if the block raises"""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
+
+def create_streaks_table():
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS streaks (
+            guild_id TEXT NOT NULL,
+            tracker TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            streak INTEGER NOT NULL DEFAULT 0,
+            last_updated TEXT,
+            first_day INTEGER,
+            history TEXT,
+            PRIMARY KEY (guild_id, tracker, user_id)
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_streaks_tracker ON streaks (guild_id, tracker, streak DESC)")
+
+def migrate_single_guild_table():
+    """Move a streaks table keyed by user alone into the legacy partition's default tracker"""
+    columns = {row[1] for row in db.execute("PRAGMA table_info(streaks)")}
+    if not columns or "guild_id" in columns:
+        return
+    first_day = "first_day" if "first_day" in columns else "NULL"
+    history = "history" if "history" in columns else "NULL"
+    with transaction():
+        db.execute("ALTER TABLE streaks RENAME TO streaks_single")
+        db.execute("DROP INDEX IF EXISTS idx_streaks_streak")
+        create_streaks_table()
+        db.execute(
+            "INSERT INTO streaks (guild_id, tracker, user_id, streak, last_updated, first_day, history) "
+            f"SELECT ?, ?, user_id, streak, last_updated, {first_day}, {history} FROM streaks_single",
+            (LEGACY_PARTITION, DEFAULT_TRACKER)
+        )
+        db.execute("DROP TABLE streaks_single")
+    print(f"📦 Moved single-server streaks into tracker {DEFAULT_TRACKER}; they join CHANNEL_ID's server at login")
+
+migrate_single_guild_table()
+create_streaks_table()
 
 def load_data():
+    """Legacy streaks.json contents, used only by the migrator"""
     with open(DATA_FILE, "r") as f:
         return json.load(f)
 
-def save_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
-
-def get_streak(user_id: str) -> int:
+def migrate_json_store():
+    """Import streaks.json into an empty database, then set the JSON file aside"""
+    if not os.path.exists(DATA_FILE):
+        return
+    if db.execute("SELECT 1 FROM streaks LIMIT 1").fetchone():
+        print(f"⚠️ {DATA_FILE} found but {DB_FILE} already has streaks; leaving it untouched")
+        return
     data = load_data()
-    return data.get(user_id, {}).get("streak", 0)
+    with transaction():
+        db.executemany(
+            "INSERT INTO streaks (guild_id, tracker, user_id, streak, last_updated) VALUES (?, ?, ?, ?, ?)",
+            [
+                (LEGACY_PARTITION, DEFAULT_TRACKER, user_id, info.get("streak", 0), info.get("last_updated"))
+                for user_id, info in data.items()
+            ]
+        )
+    os.replace(DATA_FILE, DATA_FILE + ".migrated")
+    print(f"📦 Migrated {len(data)} streaks from {DATA_FILE} to {DB_FILE}")
 
-def increment_streak(user_id: str) -> bool:
-    now = datetime.now(IST)
-    today_9pm = now.replace(hour=21, minute=0, second=0, microsecond=0)
-    window_start = today_9pm - timedelta(days=1) if now < today_9pm else today_9pm
+# === STREAK RECORDS ===
+class StreakRecord:
+    """A user's streak, last check-in in epoch seconds, and check-in history.
 
-    data = load_data()
-    user_data = data.get(user_id, {})
-    last_updated_str = user_data.get("last_updated")
-
-    if last_updated_str:
-        last_updated = datetime.fromisoformat(last_updated_str).astimezone(IST)
-        if last_updated >= window_start:
-            return False
-
-    data[user_id] = {
-        "streak": user_data.get("streak", 0) + 1,
-        "last_updated": now.isoformat()
-    }
-    save_data(data)
+    history is an int bitset: bit i is set if the user checked in during
+    window day first_day + i (see GuildConfig.window_day).
+    """
+
+    __slots__ = ("streak", "last_updated", "first_day", "history")
+
+    def __init__(self, streak, last_updated, first_day=None, history=0):
+        self.streak = streak
+        self.last_updated = last_updated
+        self.first_day = first_day
+        self.history = history
+
+    def checked_in(self, day):
+        offset = day - self.first_day if self.first_day is not None else -1
+        return offset >= 0 and (self.history >> offset) & 1 == 1
+
+    def with_check_in(self, day):
+        """(first_day, history) with the bit for day set"""
+        if self.first_day is None:
+            return day, 1
+        if day < self.first_day:
+            return day, (self.history << (self.first_day - day)) | 1
+        return self.first_day, self.history | (1 << (day - self.first_day))
+
+def backfill_history(record, config):
+    """Pre-history records: assume the current streak was consecutive days up to the last check-in"""
+    if record.first_day is None and record.streak > 0 and record.last_updated is not None:
+        record.first_day = config.window_day(record.last_updated) - record.streak + 1
+        record.history = (1 << record.streak) - 1
+        return True
+    return False
+
+class LeaderboardIndex:
+    """Users ordered by streak (highest first), tied streaks by user id.
+
+    A Fenwick tree counts users per streak value, next to one set of user ids
+    per streak. A check-in is O(log S) for S distinct streak lengths (plus a set
+    add and remove), a rank is one prefix sum, and a page finds its first streak
+    by a Fenwick descent and sorts only the tie groups it shows.
+    """
+
+    def __init__(self, capacity=1024):
+        self.streaks = {}
+        self.buckets = {}
+        self.tree = [0] * (capacity + 1)
+
+    def add(self, streak, count):
+        i = streak + 1
+        while i < len(self.tree):
+            self.tree[i] += count
+            i += i & -i
+
+    def prefix(self, streak):
+        """Users with a streak of at most streak"""
+        i, total = min(streak + 1, len(self.tree) - 1), 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, k):
+        """Smallest streak with prefix(streak) >= k, for 1 <= k <= len(self)"""
+        i, step = 0, 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            if i + step < len(self.tree) and self.tree[i + step] < k:
+                i += step
+                k -= self.tree[i]
+            step >>= 1
+        return i
+
+    def grow(self, streak):
+        """Resize the tree to hold streak (doubling) and recount it from the buckets"""
+        capacity = len(self.tree) - 1
+        while capacity <= streak:
+            capacity *= 2
+        self.tree = [0] * (capacity + 1)
+        for value, members in self.buckets.items():
+            self.add(value, len(members))
+
+    def rebuild(self, streaks):
+        self.streaks = dict(streaks)
+        self.buckets = {}
+        for user_id, streak in self.streaks.items():
+            self.buckets.setdefault(streak, set()).add(user_id)
+        self.grow(max(self.buckets, default=0))
+
+    def update(self, user_id, streak):
+        old = self.streaks.get(user_id)
+        if old == streak:
+            return
+        if old is not None:
+            members = self.buckets[old]
+            members.discard(user_id)
+            if not members:
+                del self.buckets[old]
+            self.add(old, -1)
+        if streak >= len(self.tree) - 1:
+            self.grow(streak)
+        self.buckets.setdefault(streak, set()).add(user_id)
+        self.add(streak, 1)
+        self.streaks[user_id] = streak
+
+    def page(self, offset, limit):
+        rows = []
+        total = len(self.streaks)
+        position = max(offset, 0)
+        while len(rows) < limit and position < total:
+            # The user at `position` from the top is number total - position counting up
+            streak = self.find(total - position)
+            skip = position - (total - self.prefix(streak))
+            members = sorted(self.buckets[streak])[skip:skip + limit - len(rows)]
+            rows.extend((user_id, streak) for user_id in members)
+            position += len(members)
+        return rows
+
+    def rank(self, user_id):
+        """1-based position, shared by tied streaks; None for unknown users"""
+        streak = self.streaks.get(user_id)
+        if streak is None:
+            return None
+        return len(self.streaks) - self.prefix(streak) + 1
+
+    def __len__(self):
+        return len(self.streaks)
+
+class StreakTracker:
+    """One (server, tracker) partition: its users' records and its own leaderboard"""
+
+    def __init__(self, guild_id, name):
+        self.guild_id = guild_id
+        self.name = name
+        self.records = {}
+        self.leaderboard = LeaderboardIndex()
+
+    @property
+    def config(self):
+        return config_for(self.guild_id)
+
+# Every partition's records, loaded once; the store worker is the only thread that touches records
+trackers = {}
+# (guild_id, tracker, user_id) keys changed since the last compaction
+dirty = set()
+
+def get_tracker(guild_id, name):
+    key = (str(guild_id), name)
+    tracker = trackers.get(key)
+    if tracker is None:
+        tracker = trackers[key] = StreakTracker(*key)
+    return tracker
+
+class WriteAheadLog:
+    """Append-only JSON lines of [guild_id, tracker, user_id, streak, last_updated, first_day, history hex].
+
+    Entries are absolute values, so replaying one twice is harmless. A
+    compaction first moves the log to a .compacting file; if it dies before
+    the snapshot commits, that file is replayed (and folded in) next start.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.compacting_path = path + ".compacting"
+        self.file = open(path, "a")
+        self.entries = 0
+        self.unsynced = False
+
+    def append(self, tracker, user_id, record):
+        self.file.write(json.dumps([
+            tracker.guild_id, tracker.name, user_id, record.streak, record.last_updated, record.first_day,
+            format(record.history, "x")
+        ]) + "\n")
+        self.file.flush()
+        self.entries += 1
+        self.unsynced = True
+
+    def sync(self):
+        if self.unsynced:
+            os.fsync(self.file.fileno())
+            self.unsynced = False
+
+    def rotate(self):
+        """Move the live log onto the .compacting file and start an empty one"""
+        self.sync()
+        self.file.close()
+        with open(self.path) as src, open(self.compacting_path, "a") as dst:
+            dst.write(src.read())
+            dst.flush()
+            os.fsync(dst.fileno())
+        self.file = open(self.path, "w")
+        self.entries = 0
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+def parse_timestamp(value):
+    return int(datetime.fromisoformat(value).timestamp()) if value else None
+
+def format_timestamp(value):
+    return datetime.fromtimestamp(value, IST).isoformat() if value is not None else None
+
+def replay(path):
+    """Apply a log file over the loaded records: (entries applied, offset just past the last whole line).
+
+    A torn last line (no newline, from a crash mid-write) ends the replay; the
+    caller truncates it off so the next append starts on a fresh line. A whole
+    line that does not parse is reported and skipped, since entries are absolute.
+    """
+    if not os.path.exists(path):
+        return 0, 0
+    applied = 0
+    valid_end = 0
+    with open(path, "rb") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.endswith(b"\n"):
+                print(f"⚠️ Dropping torn entry at the end of {path} (line {number})")
+                break
+            valid_end += len(line)
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                print(f"⚠️ Skipping unparsable entry on line {number} of {path}")
+                continue
+            if len(entry) == 3:  # Written before check-in history was tracked
+                entry += [None, "0"]
+            if len(entry) == 5:  # Written before streaks were per server
+                entry = [LEGACY_PARTITION, DEFAULT_TRACKER] + entry
+            guild_id, name, user_id, streak, last_updated, first_day, history = entry
+            if last_updated is not None:
+                last_updated = int(last_updated)  # Older entries hold float timestamps
+            tracker = get_tracker(guild_id, name)
+            tracker.records[user_id] = StreakRecord(streak, last_updated, first_day, int(history, 16))
+            dirty.add((tracker.guild_id, name, user_id))
+            applied += 1
+    return applied, valid_end
+
+def replay_and_repair(path):
+    """Replay a log file and cut off any torn tail, so appends never land on a partial line"""
+    applied, valid_end = replay(path)
+    if os.path.exists(path) and os.path.getsize(path) > valid_end:
+        with open(path, "r+b") as f:
+            f.truncate(valid_end)
+            os.fsync(f.fileno())
+    return applied
+
+def load_records():
+    rows = db.execute("SELECT guild_id, tracker, user_id, streak, last_updated, first_day, history FROM streaks")
+    for guild_id, name, user_id, streak, last_updated, first_day, history in rows:
+        get_tracker(guild_id, name).records[user_id] = StreakRecord(
+            streak, parse_timestamp(last_updated), first_day, int(history or "0", 16)
+        )
+    replayed = replay_and_repair(WAL_FILE + ".compacting") + replay_and_repair(WAL_FILE)
+    for tracker in trackers.values():
+        config = tracker.config
+        for user_id, record in tracker.records.items():
+            if backfill_history(record, config):
+                dirty.add((tracker.guild_id, tracker.name, user_id))
+        tracker.leaderboard.rebuild((user_id, record.streak) for user_id, record in tracker.records.items())
+    total = sum(len(tracker.records) for tracker in trackers.values())
+    print(f"📂 Loaded {total} streaks in {len(trackers)} trackers ({replayed} replayed from {WAL_FILE})")
+
+def compact():
+    """Write changed records into the snapshot and drop the log they came from"""
+    if not dirty and not os.path.exists(wal.compacting_path):
+        return 0
+    wal.rotate()
+    changed = list(dirty)
+    dirty.clear()
+    rows = []
+    for guild_id, name, user_id in changed:
+        record = trackers[(guild_id, name)].records[user_id]
+        rows.append((
+            guild_id, name, user_id, record.streak, format_timestamp(record.last_updated), record.first_day,
+            format(record.history, "x")
+        ))
+    try:
+        with transaction():
+            db.executemany(
+                "INSERT INTO streaks (guild_id, tracker, user_id, streak, last_updated, first_day, history) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(guild_id, tracker, user_id) DO UPDATE SET streak = excluded.streak, "
+                "last_updated = excluded.last_updated, first_day = excluded.first_day, history = excluded.history",
+                rows
+            )
+    except BaseException:
+        dirty.update(changed)
+        raise
+    os.remove(wal.compacting_path)
+    return len(changed)
+
+def set_record(tracker, user_id, streak, last_updated, first_day=None, history=0):
+    record = StreakRecord(streak, last_updated, first_day, history)
+    tracker.records[user_id] = record
+    dirty.add((tracker.guild_id, tracker.name, user_id))
+    tracker.leaderboard.update(user_id, streak)
+    wal.append(tracker, user_id, record)
+
+def get_streak(tracker, user_id: str) -> int:
+    record = tracker.records.get(user_id)
+    return record.streak if record else 0
+
+def increment_streak(tracker, user_id: str) -> bool:
+    now = int(time.time())
+    window_start, _, day = tracker.config.clock.current(now)
+
+    record = tracker.records.get(user_id)
+    if record and record.last_updated is not None and record.last_updated >= window_start:
+        return False
+
+    record = record or StreakRecord(0, None)
+    first_day, history = record.with_check_in(day)
+    set_record(tracker, user_id, record.streak + 1, now, first_day, history)
     return True
 
-def reset_streak(user_id: str):
-    data = load_data()
-    data[user_id] = {
-        "streak": 0,
-        "last_updated": datetime.now(IST).isoformat()
-    }
-    save_data(data)
+def check_in(tracker, user_id: str):
+    """Increment and read back in one store call: (updated, streak, stamp)"""
+    updated = increment_streak(tracker, user_id)
+    return updated, get_streak(tracker, user_id), get_streak_stamp(tracker, user_id)
 
-def get_streak_stamp(user_id):
-    data = load_data()
-    user_data = data.get(user_id)
-    if not user_data:
-        return "❌❌❌❌❌❌❌"
-
-    last_updated = datetime.fromisoformat(user_data["last_updated"]).astimezone(IST)
-    streak = user_data["streak"]
-    now = datetime.now(IST)
-
-    stamps = []
-    for i in range(6, -1, -1):
-        day = now - timedelta(days=i)
-        cutoff = day.replace(hour=21, minute=0, second=0, microsecond=0)
-        if last_updated.date() == cutoff.date() and streak > 0:
-            stamps.append("✅")
-        elif i < streak:
-            stamps.append("✅")
+def reset_streak(tracker, user_id: str):
+    # A reset ends the streak; the days already checked in stay in the history
+    record = tracker.records.get(user_id) or StreakRecord(0, None)
+    set_record(tracker, user_id, 0, int(time.time()), record.first_day, record.history)
+
+def top_streaks(tracker, limit=10, offset=0):
+    """(user_id, streak, stamp) tuples, highest streak first"""
+    config = tracker.config
+    return [
+        (user_id, streak, history_stamp(tracker.records[user_id], config))
+        for user_id, streak in tracker.leaderboard.page(offset, limit)
+    ]
+
+def get_rank(tracker, user_id):
+    """(position, total users, streak); position is None before a first check-in"""
+    return tracker.leaderboard.rank(user_id), len(tracker.leaderboard), get_streak(tracker, user_id)
+
+def history_stamp(record, config, days=7):
+    """✅/❌ for the last `days` windows, oldest first, read straight from the history bits"""
+    if record is None:
+        return "❌" * days
+    today = config.clock.current()[2]
+    return "".join("✅" if record.checked_in(day) else "❌" for day in range(today - days + 1, today + 1))
+
+def longest_streak(record):
+    """Longest run of consecutive check-in windows: each x &= x >> 1 shortens every run by one"""
+    history, longest = record.history, 0
+    while history:
+        history &= history >> 1
+        longest += 1
+    return longest
+
+def month_bits(record, year, month):
+    """(bits, days in month): bit d-1 is set if the window ending on day d was checked in"""
+    first = datetime(year, month, 1).toordinal() - EPOCH_ORDINAL
+    days = calendar.monthrange(year, month)[1]
+    if record.first_day is None:
+        return 0, days
+    shift = first - record.first_day
+    bits = record.history >> shift if shift >= 0 else record.history << -shift
+    return bits & ((1 << days) - 1), days
+
+def month_calendar(record, year, month):
+    """Monday-first grid of the month: ✅ checked in, ▫️ missed, blank outside the month"""
+    bits, days = month_bits(record, year, month)
+    lead = calendar.monthrange(year, month)[0]
+    cells = ["⬛"] * lead + ["✅" if bits >> d & 1 else "▫️" for d in range(days)]
+    cells += ["⬛"] * (-len(cells) % 7)
+    rows = ["".join(cells[i:i + 7]) for i in range(0, len(cells), 7)]
+    return "Mo Tu We Th Fr Sa Su\n" + "\n".join(rows), bin(bits).count("1")
+
+def get_history(tracker, user_id, year, month):
+    """(calendar, check-ins that month, total check-ins, longest streak, current streak)"""
+    record = tracker.records.get(user_id) or StreakRecord(0, None)
+    grid, month_total = month_calendar(record, year, month)
+    return grid, month_total, bin(record.history).count("1"), longest_streak(record), record.streak
+
+def get_streak_stamp(tracker, user_id):
+    return history_stamp(tracker.records.get(user_id), tracker.config)
+
+def adopt_legacy_partition(guild_id):
+    """Move single-server streaks from the placeholder partition into guild_id.
+
+    Compacts first so every legacy entry is in the snapshot, then re-keys the
+    rows in one transaction. A user the server already has a record for keeps it.
+    """
+    legacy = [tracker for key, tracker in list(trackers.items()) if key[0] == LEGACY_PARTITION]
+    if not legacy:
+        return 0
+    compact()
+    with transaction():
+        db.execute(
+            "UPDATE OR IGNORE streaks SET guild_id = ? WHERE guild_id = ?", (guild_id, LEGACY_PARTITION)
+        )
+        db.execute("DELETE FROM streaks WHERE guild_id = ?", (LEGACY_PARTITION,))
+    moved = 0
+    for tracker in legacy:
+        target = get_tracker(guild_id, tracker.name)
+        for user_id, record in tracker.records.items():
+            if user_id not in target.records:
+                target.records[user_id] = record
+                moved += 1
+        target.leaderboard.rebuild((user_id, record.streak) for user_id, record in target.records.items())
+        del trackers[(LEGACY_PARTITION, tracker.name)]
+    return moved
+
+migrate_json_store()
+load_records()
+wal = WriteAheadLog(WAL_FILE)
+
+# === ASYNC PERSISTENCE ===
+# One worker thread, so every record change, log append and compaction runs in submission order.
+# It is the single writer: a check-in's read-modify-write never interleaves with another's.
+store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="streaks")
+store_stats = {"calls": 0, "loop_seconds": 0.0}
+# Set once shutdown starts draining the worker; later store calls are refused
+store_closed = False
+
+class ShuttingDown(commands.CheckFailure):
+    """A command or store call arrived after shutdown began"""
+
+async def run_store(func, *args):
+    """Run a streak helper off the event loop, timing what stays on it"""
+    if store_closed:
+        raise ShuttingDown()
+    started = time.perf_counter()
+    try:
+        if not ASYNC_PERSISTENCE:
+            return func(*args)
+        future = asyncio.get_running_loop().run_in_executor(store_executor, func, *args)
+    finally:
+        store_stats["loop_seconds"] += time.perf_counter() - started
+        store_stats["calls"] += 1
+    return await future
+
+class LoopLagMonitor:
+    """Samples how late the event loop wakes up, i.e. how long it was blocked"""
+
+    def __init__(self, interval=0.25, window=2400):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.task = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def summary(self):
+        if not self.samples:
+            return {"max_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0, "blocked_s": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "max_ms": ordered[-1] * 1000,
+            "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+            "mean_ms": sum(ordered) / len(ordered) * 1000,
+            "blocked_s": sum(ordered)
+        }
+
+loop_lag = LoopLagMonitor()
+
+# === SHUTDOWN ===
+shutdown_task = None
+stopping = False
+
+async def shutdown():
+    """Refuse new commands, stop the background loops, compact the log into the snapshot, then log out.
+
+    Store calls queued before the worker is drained still run and land in the
+    log; ones arriving after that raise ShuttingDown instead of failing in the pool.
+    """
+    global stopping, store_closed
+    stopping = True
+    for loop in (sync_wal, compact_snapshot):
+        loop.cancel()
+    for task in (reminders.task, loop_lag.task):
+        if task is not None:
+            task.cancel()
+    try:
+        try:
+            await asyncio.wait_for(run_store(compact), SHUTDOWN_DEADLINE_SECONDS)
+        except asyncio.TimeoutError:
+            pass  # Reported below once the worker fails to drain
+        except Exception as e:
+            print(f"⚠️ Compaction on shutdown failed, the log still holds every change: {e}")
+        store_closed = True
+        try:
+            await asyncio.wait_for(asyncio.to_thread(store_executor.shutdown, True), SHUTDOWN_DEADLINE_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Streak writes still pending after {SHUTDOWN_DEADLINE_SECONDS}s, exiting anyway")
         else:
-            stamps.append("❌")
-    return "".join(stamps)
+            wal.close()
+            db.close()
+    except Exception as e:
+        print(f"⚠️ Flushing streaks on shutdown failed: {e}")
+    finally:
+        await bot.close()
+
+def request_shutdown(sig):
+    global shutdown_task
+    if shutdown_task is None:
+        print(f"🛑 Received {signal.Signals(sig).name}, shutting down")
+        shutdown_task = asyncio.create_task(shutdown())
+
+def install_signal_handlers():
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, request_shutdown, sig)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: discord.py's KeyboardInterrupt handling still applies
 
 RANKS = [
     (1095, "🕊️💎 Eternal Transcendent"),
@@ -165,11 +847,67 @@ RANKS = [
     (5, "⚔️ D-Rank Reaper"),
     (1, "🐣 E-Rank Seeker")
 ]
-def get_rank_title(streak):
-    for threshold, title in RANKS:
-        if streak >= threshold:
-            return title
-    return "Unranked"
+MILESTONES = (
+    7, 21, 30, 40, 45, 55, 69, 75, 90, 100, 150, 200, 250, 300, 350, 400, 450, 500, 550, 600, 650, 700, 750,
+    800, 850, 900, 1000, 1100, 1200, 1300, 1400, 1500, 1600, 1700, 1800, 1900, 2000, 2100, 2200, 2300, 2400,
+    2500, 2600, 2700, 2800, 2900, 3000
+)
+
+# === RANK LADDERS ===
+class RankLadder:
+    """Rank titles as sorted thresholds for bisect lookup, plus a milestone set"""
+
+    def __init__(self, ranks, milestones):
+        # Thresholds ascending; on a duplicate the entry listed first wins, as in RANKS order
+        by_threshold = {}
+        for threshold, title in ranks:
+            by_threshold.setdefault(int(threshold), title)
+        self.thresholds = sorted(by_threshold)
+        self.titles = [by_threshold[threshold] for threshold in self.thresholds]
+        self.milestones = frozenset(int(days) for days in milestones)
+
+    def title(self, streak):
+        i = bisect.bisect_right(self.thresholds, streak) - 1
+        return self.titles[i] if i >= 0 else "Unranked"
+
+    def is_milestone(self, streak):
+        return streak in self.milestones
+
+default_ladder = RankLadder(RANKS, MILESTONES)
+guild_ladders = {}
+
+def load_ladders(path=RANKS_FILE):
+    """Read ranks.json: {"default" | "<guild id>": {"ranks": [[days, title], ...], "milestones": [days, ...]}}.
+
+    A guild entry may give only ranks or only milestones; the rest comes from "default",
+    then the built-in tables. A broken file keeps the current ladders.
+    """
+    global default_ladder, guild_ladders
+    if not os.path.exists(path):
+        default_ladder, guild_ladders = RankLadder(RANKS, MILESTONES), {}
+        return
+    try:
+        with open(path, "r") as f:
+            config = json.load(f)
+        base = config.get("default", {})
+        base_ranks = base.get("ranks", RANKS)
+        base_milestones = base.get("milestones", MILESTONES)
+        ladders = {
+            str(guild_id): RankLadder(entry.get("ranks", base_ranks), entry.get("milestones", base_milestones))
+            for guild_id, entry in config.items() if guild_id != "default"
+        }
+        default_ladder, guild_ladders = RankLadder(base_ranks, base_milestones), ladders
+        print(f"🏅 Loaded rank ladders from {path} ({len(ladders)} guild overrides)")
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        print(f"⚠️ Could not load {path}, keeping current ladders: {e}")
+
+def ladder_for(guild_id=None):
+    return guild_ladders.get(str(guild_id), default_ladder)
+
+def get_rank_title(streak, guild_id=None):
+    return ladder_for(guild_id).title(streak)
+
+load_ladders()
 
 intents = discord.Intents.default()
 intents.messages = True
@@ -179,62 +917,283 @@ intents.members = True
 
 bot = commands.Bot(command_prefix="!", intents=intents)
 
+@bot.check
+async def accepting_commands(ctx):
+    if stopping:
+        raise ShuttingDown()
+    return True
+
+@bot.event
+async def on_command_error(ctx, error):
+    if isinstance(error, ShuttingDown):
+        await ctx.send("🛑 The bot is restarting, try again in a minute.")
+        return
+    await commands.Bot.on_command_error(bot, ctx, error)
+
+# === USERNAMES ===
+db.execute("""
+    CREATE TABLE IF NOT EXISTS usernames (
+        user_id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        fetched_at REAL NOT NULL
+    )
+""")
+
+def save_usernames(rows):
+    with transaction():
+        db.executemany(
+            "INSERT INTO usernames (user_id, name, fetched_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET name = excluded.name, fetched_at = excluded.fetched_at",
+            rows
+        )
+
+class UsernameResolver:
+    """id -> display name from the member cache, then a persisted TTL cache, then Discord.
+
+    Misses are fetched concurrently; a failed fetch falls back to an expired
+    cached name before the bare user ID.
+    """
+
+    def __init__(self, ttl_hours=USERNAME_TTL_HOURS):
+        self.ttl = ttl_hours * 3600
+        self.names = {
+            user_id: (name, fetched_at)
+            for user_id, name, fetched_at in db.execute("SELECT user_id, name, fetched_at FROM usernames")
+        }
+
+    def from_members(self, user_id, guild_id=None):
+        """Display name in the leaderboard's own server; other servers only if it has no such member"""
+        home = bot.get_guild(int(guild_id)) if guild_id and str(guild_id).isdigit() else None
+        if home is not None:
+            member = home.get_member(int(user_id))
+            if member is not None:
+                return member.display_name
+        for guild in bot.guilds:
+            if guild is home:
+                continue
+            member = guild.get_member(int(user_id))
+            if member is not None:
+                return member.display_name
+        return None
+
+    async def fetch(self, user_id):
+        return (await bot.fetch_user(int(user_id))).display_name
+
+    async def resolve(self, user_ids, guild_id=None):
+        now = time.time()
+        names = {}
+        misses = []
+        for user_id in user_ids:
+            name = self.from_members(user_id, guild_id)
+            cached = self.names.get(user_id)
+            if name is None and cached and now - cached[1] < self.ttl:
+                name = cached[0]
+            if name is None:
+                misses.append(user_id)
+            else:
+                names[user_id] = name
+
+        fetched = await asyncio.gather(*(self.fetch(user_id) for user_id in misses), return_exceptions=True)
+        updates = []
+        for user_id, name in zip(misses, fetched):
+            if isinstance(name, Exception):
+                cached = self.names.get(user_id)
+                names[user_id] = cached[0] if cached else f"User ID {user_id}"
+                continue
+            names[user_id] = name
+            self.names[user_id] = (name, now)
+            updates.append((user_id, name, now))
+        if updates:
+            await run_store(save_usernames, updates)
+        return names
+
+usernames = UsernameResolver()
+
 @bot.event
 async def on_ready():
     print(f'✅ Logged in as {bot.user.name}')
-    reminder_check.start()
+    install_signal_handlers()
+    loop_lag.start()
+    await adopt_legacy_guild()
+    reminders.start()
+    for loop in (sync_wal, compact_snapshot):
+        if not loop.is_running():
+            loop.start()
+
+async def adopt_legacy_guild():
+    """Give CHANNEL_ID's server its reminder config and the single-server streaks"""
+    global legacy_guild_id
+    channel = bot.get_channel(CHANNEL_ID)
+    if channel is None or getattr(channel, "guild", None) is None:
+        print(f"⚠️ Channel {CHANNEL_ID} not found; single-server streaks stay unassigned")
+        return
+    if legacy_guild_id != str(channel.guild.id):
+        legacy_guild_id = str(channel.guild.id)
+        load_guild_configs()
+    moved = await run_store(adopt_legacy_partition, legacy_guild_id)
+    if moved:
+        print(f"📦 Moved {moved} single-server streaks into {channel.guild.name}")
+
+def tracker_for(guild, name=None):
+    """The server's tracker called name (its first tracker by default); None if it has no such tracker"""
+    name = config_for(guild.id).tracker_name(name)
+    return get_tracker(guild.id, name) if name else None
+
+async def resolve_tracker(ctx, name=None):
+    if ctx.guild is None:
+        await ctx.send("⚠️ Streaks are kept per server, use this command in a server channel.")
+        return None
+    tracker = tracker_for(ctx.guild, name)
+    if tracker is None:
+        available = ", ".join(f"`{tracker}`" for tracker in config_for(ctx.guild.id).trackers)
+        await ctx.send(f"⚠️ This server has no `{name}` tracker. Trackers here: {available}")
+    return tracker
 
 @bot.command()
-async def streakon(ctx):
+async def streakon(ctx, tracker: str = None):
+    tracker = await resolve_tracker(ctx, tracker)
+    if tracker is None:
+        return
     user_id = str(ctx.author.id)
+    updated, new_streak, stamp = await run_store(check_in, tracker, user_id)
     
-    if increment_streak(user_id):
-        await asyncio.sleep(1)
-        new_streak = get_streak(user_id)
-        rank = get_rank_title(new_streak)
-        stamp = get_streak_stamp(user_id)
+    if updated:
+        rank = get_rank_title(new_streak, tracker.guild_id)
 
         celebration = ""
         # ✅ FIX: check the *new* streak for milestone, not yesterday
-        if new_streak in [7, 21, 30,40, 45,55, 69, 75, 90, 100,150,200,250,300,350,400,450,500,550,600,650,700,750,800,850,900,1000,1100,1200,1300,1400,1500,1600,1700,1800,1900,2000,2100,2200,2300,2400,2500,2600,2700,2800,2900,3000]:
+        if ladder_for(tracker.guild_id).is_milestone(new_streak):
             celebration = f"🎉 **Milestone achieved: {new_streak} days!** 🎉\n"
 
         await ctx.send(
-            f"✅ {ctx.author.mention} Streak updated!\n🔥 Current streak: **{new_streak} days**\n"
+            f"✅ {ctx.author.mention} {tracker.name} streak updated!\n🔥 Current streak: **{new_streak} days**\n"
             f"🏅 Rank: {rank}\n🗓️ History: {stamp}\n{celebration}"
         )
     else:
-        await ctx.send(f"⚠️ {ctx.author.mention} You’ve already checked in today. Try again after 9 PM!")
+        await ctx.send(
+            f"⚠️ {ctx.author.mention} You’ve already checked in today. Try again after {tracker.config.cutoff_label()}!"
+        )
 
 @bot.command()
-async def streakbroken(ctx):
-    reset_streak(str(ctx.author.id))
-    await ctx.send(f"❌ {ctx.author.mention} Your streak has been reset to 0. Let's restart 🔁")
+async def streakbroken(ctx, tracker: str = None):
+    tracker = await resolve_tracker(ctx, tracker)
+    if tracker is None:
+        return
+    await run_store(reset_streak, tracker, str(ctx.author.id))
+    await ctx.send(f"❌ {ctx.author.mention} Your {tracker.name} streak has been reset to 0. Let's restart 🔁")
 
 @bot.command()
-async def nightfall(ctx):
-    streak = get_streak(str(ctx.author.id))
+async def nightfall(ctx, tracker: str = None):
+    tracker = await resolve_tracker(ctx, tracker)
+    if tracker is None:
+        return
+    streak = await run_store(get_streak, tracker, str(ctx.author.id))
     await ctx.send(
         f"🌙 {ctx.author.mention} It is fine, don't feel guilty. It is a natural process. No loss.\n🔥 Your streak remains: **{streak} days**"
     )
 
+async def build_leaderboard(tracker, page=1):
+    """Leaderboard message for a 1-based page of LEADERBOARD_PAGE_SIZE users"""
+    pages = max(1, -(-len(tracker.leaderboard) // LEADERBOARD_PAGE_SIZE))
+    page = min(max(page, 1), pages)
+    offset = (page - 1) * LEADERBOARD_PAGE_SIZE
+    rows = await run_store(top_streaks, tracker, LEADERBOARD_PAGE_SIZE, offset)
+    names = await usernames.resolve([user_id for user_id, _, _ in rows], tracker.guild_id)
+    message = f"**🏆 {tracker.name} Leaderboard 🏆**\n\n"
+
+    for i, (user_id, streak, stamp) in enumerate(rows, start=offset + 1):
+        username = names[user_id]
+        rank = get_rank_title(streak, tracker.guild_id)
+        message += f"**#{i}** - {username} — **{streak}** days | {rank} | {stamp}\n"
+
+    if pages > 1:
+        message += f"\n📄 Page {page}/{pages} — `!leaderboard <page> {tracker.name}` for more"
+    return message
+
 @bot.command()
-async def leaderboard(ctx):
-    data = load_data()
-    sorted_data = sorted(data.items(), key=lambda x: x[1].get("streak", 0), reverse=True)
-    message = "**🏆 NoFap Leaderboard 🏆**\n\n"
+async def leaderboard(ctx, page: Optional[int] = 1, tracker: str = None):
+    # Optional[int] lets `!leaderboard NoFap` skip the page and go straight to the tracker
+    tracker = await resolve_tracker(ctx, tracker)
+    if tracker is None:
+        return
+    await ctx.send(await build_leaderboard(tracker, page))
 
-    for i, (user_id, info) in enumerate(sorted_data[:10], start=1):
-        try:
-            user_obj = await bot.fetch_user(int(user_id))
-            username = user_obj.name
-        except:
-            username = f"User ID {user_id}"
-        rank = get_rank_title(info["streak"])
-        stamp = get_streak_stamp(user_id)
-        message += f"**#{i}** - {username} — **{info['streak']}** days | {rank} | {stamp}\n"
+@bot.command()
+async def history(ctx, month: str = None, tracker: str = None):
+    """Check-in calendar for a month (YYYY-MM, default this one)"""
+    try:
+        when = datetime.strptime(month, "%Y-%m") if month else None
+    except ValueError:
+        if tracker is not None:
+            await ctx.send("⚠️ Use `!history YYYY-MM [tracker]`, e.g. `!history 2025-06`")
+            return
+        when, tracker = None, month  # `!history <tracker>` for this month
+    tracker = await resolve_tracker(ctx, tracker)
+    if tracker is None:
+        return
+    when = when or tracker.config.now()
+    grid, month_total, total, longest, current = await run_store(
+        get_history, tracker, str(ctx.author.id), when.year, when.month
+    )
+    await ctx.send(
+        f"🗓️ {ctx.author.mention} {tracker.name} **{when.strftime('%B %Y')}** — {month_total} check-ins\n{grid}\n"
+        f"🔥 Current: **{current}** | 🏔️ Longest ever: **{longest}** | ✅ Total check-ins: **{total}**"
+    )
+
+@bot.command()
+async def myrank(ctx, tracker: str = None):
+    tracker = await resolve_tracker(ctx, tracker)
+    if tracker is None:
+        return
+    position, total, streak = await run_store(get_rank, tracker, str(ctx.author.id))
+    if position is None:
+        await ctx.send(f"📭 {ctx.author.mention} You haven't checked in yet. Use `!streakon` to start!")
+        return
+    await ctx.send(f"🏅 {ctx.author.mention} You are **#{position}** of {total} with **{streak} days** ({get_rank_title(streak, tracker.guild_id)})")
 
-    await ctx.send(message)
+@bot.command(name="trackers")
+async def list_trackers(ctx):
+    if ctx.guild is None:
+        await ctx.send("⚠️ Streaks are kept per server, use this command in a server channel.")
+        return
+    config = config_for(ctx.guild.id)
+    await ctx.send(
+        f"📋 Trackers here: {', '.join(f'`{name}`' for name in config.trackers)} (first is the default)\n"
+        f"🕘 New day starts at {config.cutoff_label()} ({config.tz.zone})"
+    )
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def reloadguilds(ctx):
+    load_guild_configs()
+    reminders.rebuild()
+    config = config_for(ctx.guild.id if ctx.guild else None)
+    await ctx.send(
+        f"🌐 Server configs reloaded — this server: trackers `{', '.join(config.trackers)}`, "
+        f"cutoff `{config.cutoff_label()}` ({config.tz.zone}), reminders {'on' if config.channel_id else 'off'}"
+    )
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def reloadranks(ctx):
+    load_ladders()
+    ladder = ladder_for(ctx.guild.id if ctx.guild else None)
+    await ctx.send(f"🏅 Rank ladders reloaded — this server: `{len(ladder.titles)}` ranks, `{len(ladder.milestones)}` milestones")
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def iostats(ctx):
+    lag = loop_lag.summary()
+    mode = "worker thread" if ASYNC_PERSISTENCE else "inline on event loop"
+    per_call = store_stats["loop_seconds"] / max(store_stats["calls"], 1) * 1000
+    await ctx.send(
+        f"🧮 **I/O stats** ({mode})\n"
+        f"⏱️ Loop lag — max `{lag['max_ms']:.1f}ms`, p99 `{lag['p99_ms']:.1f}ms`, mean `{lag['mean_ms']:.2f}ms`, "
+        f"blocked `{lag['blocked_s']:.2f}s` over {len(loop_lag.samples)} samples\n"
+        f"📂 Storage — `{store_stats['calls']}` calls, `{per_call:.2f}ms` on loop per call\n"
+        f"🗃️ Records — `{sum(len(tracker.records) for tracker in list(trackers.values()))}` streaks in `{len(trackers)}` trackers, "
+        f"`{wal.entries}` log entries since compaction, `{len(dirty)}` dirty"
+    )
 
 @bot.event
 async def on_message(message):
@@ -242,62 +1201,154 @@ async def on_message(message):
         return
 
     SAPPHIRE_ID = 678344927997853742
-    if message.author.id == SAPPHIRE_ID and message.mentions:
+    if message.author.id == SAPPHIRE_ID and message.mentions and message.guild and not stopping:
         mentioned_user = message.mentions[0]
         user_id = str(mentioned_user.id)
         content = message.content.lower()
+        # Sapphire relays always go to the server's default tracker
+        tracker = tracker_for(message.guild)
 
         if "!streakon" in content:
-            if increment_streak(user_id):
-                streak = get_streak(user_id)
+            updated, streak, _ = await run_store(check_in, tracker, user_id)
+            if updated:
                 await message.channel.send(f"✅ {mentioned_user.mention} Streak updated! Current streak: **{streak} days** 💪")
             else:
-                now = datetime.now(IST)
-                today_9pm = now.replace(hour=21, minute=0, second=0, microsecond=0)
-                next_checkin = today_9pm if now < today_9pm else today_9pm + timedelta(days=1)
-                diff = next_checkin - now
-                hours, remainder = divmod(diff.seconds, 3600)
+                now = int(time.time())
+                hours, remainder = divmod(tracker.config.clock.current(now)[1] - now, 3600)
                 minutes = remainder // 60
                 await message.channel.send(f"⚠️ {mentioned_user.mention} Already checked in today. Your next Check in **{hours}h {minutes}m** ")
 
         elif "!streakbroken" in content or "!justdone" in content:
-            reset_streak(user_id)
+            await run_store(reset_streak, tracker, user_id)
             await message.channel.send(f"❌ {mentioned_user.mention} Your streak has been reset to 0. Let's restart 🔁")
 
         elif "!nightfall" in content:
-            streak = get_streak(user_id)
+            streak = await run_store(get_streak, tracker, user_id)
             await message.channel.send(
                 f"🌙 {mentioned_user.mention} It is fine, don't feel guilty. It is a natural process. No loss.\n🔥 Your streak remains: **{streak} days**"
             )
 
         elif "!leaderboard" in content:
-            data = load_data()
-            sorted_data = sorted(data.items(), key=lambda x: x[1].get("streak", 0), reverse=True)
-            msg = "**🏆 NoFap Leaderboard 🏆**\n\n"
-            for i, (uid, info) in enumerate(sorted_data[:10], start=1):
-                try:
-                    user_obj = await bot.fetch_user(int(uid))
-                    name = user_obj.name
-                except:
-                    name = f"User ID {uid}"
-                rank = get_rank_title(info["streak"])
-                stamp = get_streak_stamp(uid)
-                msg += f"**#{i}** - {name} — **{info['streak']}** days | {rank} | {stamp}\n"
-            await message.channel.send(msg)
+            await message.channel.send(await build_leaderboard(tracker))
 
     await bot.process_commands(message)
 
-@tasks.loop(minutes=1)
-async def reminder_check():
-    now = datetime.now(IST)
-    if now.hour == 21 and now.minute == 0:
-        channel = bot.get_channel(CHANNEL_ID)
-        guild = discord.utils.get(bot.guilds)
-        if guild:
-            role = discord.utils.get(guild.roles, id=ROLE_ID)
-            if channel and role:
+@tasks.loop(seconds=WAL_FSYNC_SECONDS)
+async def sync_wal():
+    try:
+        await run_store(wal.sync)
+        if wal.entries >= COMPACT_WAL_ENTRIES:
+            await run_store(compact)
+    except Exception as e:
+        print(f"⚠️ Log sync or compaction failed, retrying next tick: {e}")
+
+@tasks.loop(minutes=COMPACT_MINUTES)
+async def compact_snapshot():
+    try:
+        await run_store(compact)
+    except Exception as e:
+        print(f"⚠️ Compaction failed, keeping the log: {e}")
+
+# === REMINDERS ===
+db.execute("""
+    CREATE TABLE IF NOT EXISTS reminders (
+        guild_id TEXT PRIMARY KEY,
+        last_fired REAL NOT NULL
+    )
+""")
+
+def save_reminder_fires(rows):
+    with transaction():
+        db.executemany(
+            "INSERT INTO reminders (guild_id, last_fired) VALUES (?, ?) "
+            "ON CONFLICT(guild_id) DO UPDATE SET last_fired = excluded.last_fired",
+            rows
+        )
+
+class ReminderScheduler:
+    """Sends each server's daily reminder at its cutoff, sleeping until the earliest one is due.
+
+    A heap holds (fire time, guild id) for every server with a reminder channel.
+    The cutoff each server was last reminded for is kept in the reminders table
+    before the message goes out, so a restart never repeats a reminder, and one
+    missed by less than REMINDER_GRACE_MINUTES is still sent.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.last_fired = dict(db.execute("SELECT guild_id, last_fired FROM reminders"))
+        self.wake = asyncio.Event()
+        self.task = None
+
+    def first_fire(self, guild_id, config, now):
+        """The cutoff that just passed if it was missed within the grace period, else the next one"""
+        previous, following, _ = config.clock.current(int(now))
+        if self.last_fired.get(guild_id, 0) < previous and now - previous < REMINDER_GRACE_MINUTES * 60:
+            return previous
+        return following
+
+    def rebuild(self):
+        """Schedule every configured server afresh; call after the guild configs change"""
+        now = time.time()
+        self.heap = [
+            (self.first_fire(guild_id, config, now), guild_id)
+            for guild_id, config in guild_configs.items() if config.channel_id
+        ]
+        heapq.heapify(self.heap)
+        self.wake.set()
+
+    async def fire_due(self):
+        now = time.time()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            fire_at, guild_id = heapq.heappop(self.heap)
+            config = guild_configs.get(guild_id)
+            if config is None or not config.channel_id:
+                continue
+            heapq.heappush(self.heap, (config.clock.compute(int(fire_at))[1], guild_id))
+            if self.last_fired.get(guild_id, 0) >= fire_at or now - fire_at > REMINDER_GRACE_MINUTES * 60:
+                continue  # Already sent, or too late to be useful (the clock jumped or the loop stalled)
+            self.last_fired[guild_id] = fire_at
+            due.append((guild_id, fire_at))
+        if due:
+            await run_store(save_reminder_fires, due)
+            await asyncio.gather(*(self.send(guild_id, guild_configs[guild_id]) for guild_id, _ in due))
+
+    async def send(self, guild_id, config):
+        guild = bot.get_guild(int(guild_id))
+        if guild is None:
+            return
+        channel = guild.get_channel(config.channel_id)
+        role = guild.get_role(config.role_id) if config.role_id else None
+        if channel and role:
+            try:
                 await channel.send(f"🔔 {role.mention} ⬇️ **Choose Option Below**⬇️ **Daily Check in**")
+            except discord.HTTPException as e:
+                print(f"⚠️ Reminder for server {guild_id} failed: {e}")
+
+    async def run(self):
+        while True:
+            self.wake.clear()
+            try:
+                await self.fire_due()
+            except Exception as e:
+                print(f"⚠️ Reminder scheduler error: {e}")
+                await asyncio.sleep(60)
+                continue
+            delay = self.heap[0][0] - time.time() if self.heap else REMINDER_MAX_SLEEP_SECONDS
+            try:
+                await asyncio.wait_for(self.wake.wait(), min(max(delay, 0), REMINDER_MAX_SLEEP_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.rebuild()
+            self.task = asyncio.create_task(self.run())
+
+reminders = ReminderScheduler()
 
-bot.run(DISCORD_TOKEN)
+if __name__ == "__main__":
+    bot.run(DISCORD_TOKEN)
 
 
@@ -0,0 +1,170 @@
+"""Burst test for Streak_bot check-ins.
+
+Fires thousands of simultaneous check-ins at the bot's handlers, the way the
+21:00 IST reminder does. Every user checks in several times at once through
+`!streakon` and the Sapphire relay in on_message. Then the script verifies
+that each user's streak went up exactly once and nothing was lost, both in
+memory and after compaction into the snapshot. Discord is mocked out and the
+streak files live in a temporary directory.
+
+    python Streak_burst.py --users 5000 --repeats 3
+    python Streak_burst.py --users 5000 --inline
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SEED_STREAK = 3
+GUILD_ID = 4242  # Unconfigured, so it gets the default tracker and cutoff
+
+# === FAKES ===
+class FakeAuthor:
+    def __init__(self, user_id, bot=False):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+        self.name = f"user{user_id}"
+        self.bot = bot
+
+class FakeGuild:
+    def __init__(self, guild_id=GUILD_ID):
+        self.id = guild_id
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+
+class FakeContext(FakeChannel):
+    """Just enough of commands.Context for the !streakon callback"""
+
+    def __init__(self, user_id):
+        super().__init__()
+        self.author = FakeAuthor(user_id)
+        self.guild = FakeGuild()
+
+class FakeMessage:
+    """A Sapphire relay message mentioning the member who checked in"""
+
+    def __init__(self, sapphire_id, user_id, channel):
+        self.author = FakeAuthor(sapphire_id, bot=True)
+        self.mentions = [FakeAuthor(user_id)]
+        self.content = f"!streakon <@{user_id}>"
+        self.channel = channel
+        self.guild = FakeGuild()
+
+# === HARNESS ===
+def load_streak_bot(workdir):
+    """Import Streak_bot with streaks.db and streaks.wal inside workdir"""
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    module = importlib.import_module("Streak_bot")
+    module.bot._connection.user = FakeAuthor(0, bot=True)
+    return module
+
+def default_tracker(module):
+    return module.tracker_for(FakeGuild())
+
+async def seed(module, users):
+    """Give every user a streak last checked in two days ago, compacted into the snapshot"""
+    tracker = default_tracker(module)
+    checked_in = int((datetime.now(module.IST) - timedelta(days=2)).timestamp())
+    for user_id in range(1, users + 1):
+        await module.run_store(module.set_record, tracker, str(user_id), SEED_STREAK, checked_in)
+    await module.run_store(module.compact)
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def burst(module, users, repeats, sapphire_share, rng):
+    """Every user checks in `repeats` times at once; returns per-call latencies and replies"""
+    relay = FakeChannel()
+    contexts = []
+    calls = []
+    for user_id in range(1, users + 1):
+        for _ in range(repeats):
+            if rng.random() < sapphire_share:
+                calls.append(module.on_message(FakeMessage(678344927997853742, user_id, relay)))
+            else:
+                ctx = FakeContext(user_id)
+                contexts.append(ctx)
+                calls.append(module.streakon.callback(ctx))
+    rng.shuffle(calls)
+
+    latencies = []
+
+    async def timed(call):
+        started = time.perf_counter()
+        await call
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(call) for call in calls))
+    elapsed = time.perf_counter() - started
+    replies = relay.sent + [reply for ctx in contexts for reply in ctx.sent]
+    return elapsed, latencies, replies
+
+def verify(module, users, replies):
+    """(lost, doubled, confirmations, snapshot_ok) for the burst just run"""
+    expected = SEED_STREAK + 1
+    tracker = default_tracker(module)
+    streaks = [module.get_streak(tracker, str(user_id)) for user_id in range(1, users + 1)]
+    lost = sum(1 for streak in streaks if streak < expected)
+    doubled = sum(1 for streak in streaks if streak > expected)
+    confirmations = sum(1 for reply in replies if "streak updated" in reply.lower())
+
+    module.compact()
+    in_snapshot = module.db.execute("SELECT COUNT(*) FROM streaks WHERE streak = ?", (expected,)).fetchone()[0]
+    return lost, doubled, confirmations, in_snapshot == users
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="streak-burst-")
+    module = load_streak_bot(workdir)
+    module.ASYNC_PERSISTENCE = not args.inline
+    await seed(module, args.users)
+
+    rng = random.Random(args.seed)
+    elapsed, latencies, replies = await burst(module, args.users, args.repeats, args.sapphire_share, rng)
+    total = len(latencies)
+    wal_entries = module.wal.entries
+    await asyncio.to_thread(module.store_executor.shutdown, True)
+    lost, doubled, confirmations, snapshot_ok = verify(module, args.users, replies)
+
+    mode = "inline on event loop" if args.inline else "store worker thread"
+    print(f"Streak check-in burst ({mode})")
+    print(f"  users {args.users} x {args.repeats} simultaneous check-ins = {total} calls")
+    print(f"  elapsed {elapsed:.2f}s | {total / elapsed:,.0f} check-ins/s")
+    print(
+        f"  latency p50 {percentile(latencies, 50) * 1000:.1f}ms | p95 {percentile(latencies, 95) * 1000:.1f}ms | "
+        f"p99 {percentile(latencies, 99) * 1000:.1f}ms | max {max(latencies) * 1000:.1f}ms"
+    )
+    print(f"  log entries {wal_entries} (expected {args.users})")
+    print(f"  confirmations {confirmations} (expected {args.users})")
+    print(f"  lost updates {lost} | double increments {doubled} | snapshot {'consistent' if snapshot_ok else 'MISMATCH'}")
+    print(f"  state left in {workdir}")
+
+    ok = not lost and not doubled and confirmations == args.users and wal_entries == args.users and snapshot_ok
+    print("✅ no lost or duplicated check-ins" if ok else "❌ check-in burst lost or duplicated updates")
+    return 0 if ok else 1
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000, help="Members checking in at once")
+    parser.add_argument("--repeats", type=int, default=2, help="Simultaneous check-ins per member")
+    parser.add_argument("--sapphire-share", type=float, default=0.3, help="Fraction relayed through Sapphire")
+    parser.add_argument("--inline", action="store_true", help="Run the store inline (ASYNC_PERSISTENCE = False)")
+    parser.add_argument("--seed", type=int, default=7, help="Shuffle seed")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))